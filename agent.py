@@ -1,8 +1,24 @@
+import asyncio
+import copy
+import io
 import json
 import sys
-from typing import List, Tuple
-from openai import OpenAI
-from tools import load_plan
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Tuple
+from openai import AsyncOpenAI, OpenAI
+from atlantis import PlanSection, is_atlantis_comment, split_projects
+from context_budget import (
+    change_priority, family_address, instance_families, merge_details, merge_values, pack_bullets, pack_tool_output,
+)
+from fingerprint import plan_fingerprint
+from plan_cache import load_plan_table_cached, parse_plan_table_cached
+from plan_table import PlanTable, module_path
+from response_cache import ResponseCache, default_response_cache
+from tools import (
+    count_changes, count_plan_changes, iter_resource_changes_stream, open_plan_binary, summarize_actions,
+)
 from reward import score
 
 BOT_PROMPT = """You are a Terraform plan assistant that explains infrastructure changes concisely for developers.
@@ -24,146 +40,774 @@ Examples:
 
 Extract meaningful names and configuration from the plan details, not just the terraform resource names.
 
+A line ending in "×N", like "create aws_instance.web[0..199] ×200", stands for N changes.
+
 If there are more than 5 changes, ask "Count only or full summary?" 
 - If user says "Count only", respond with just 'Summary: N changes' on a single line
 - If user wants full summary, provide the detailed action statements above
 
 Be concise but informative - include the details that matter for understanding the actual impact."""
 
+MAP_PROMPT = """You are a Terraform plan assistant summarizing one part of a very large plan for developers.
+
+List the changes of this part as concise action statements, like "Deleting RDS database 'prod-db' (aws_db_instance.main)". Group similar changes, put destroys and replacements first, and keep names, environments and key configuration. Do not write a 'Summary:' line; the parts are merged later."""
+
+
+# Attributes shown in bullets, as (attribute, label, unit)
+DETAIL_FIELDS = [
+    ('name', 'name', ''),
+    ('display_name', 'display_name', ''),
+    ('instance_type', 'type', ''),
+    ('memory_size_gb', 'memory', 'GB'),
+    ('region', 'region', ''),
+    ('location_id', 'location', ''),
+    ('tier', 'tier', ''),
+    ('redis_version', 'version', ''),
+]
+# Atlantis projects explained at once
+PROJECT_WORKERS = 8
+# The prompt has the model ask "Count only or full summary?" for plans with more changes than this
+QUESTION_MIN_CHANGES = 5
+# Plans with more changes than this are summarized part by part, then merged (map-reduce)
+MAP_REDUCE_MIN_CHANGES = 500
+# Changes per map-reduce part; small modules are merged into one part
+MAP_PARTITION_CHANGES = 200
+# Map-reduce parts summarized at once
+MAP_WORKERS = 8
+# Best-of-N samples in flight at once
+BEST_OF_N_CONCURRENCY = 5
+# Early-exit best-of-N stops at this score, and keeps fewer samples in flight
+EARLY_EXIT_SCORE = 100
+EARLY_EXIT_CONCURRENCY = 2
+# Seconds to wait for the connection warm-up request
+WARM_UP_TIMEOUT = 10
+# Chat model every request goes to
+MODEL = "gpt-4o-mini"
 
-def build_context(system: str, tool_output: List[str], history: List[dict], mcp_version="1.0") -> str:
+
+def build_context(system: str, tool_output: List[str], history: List[dict], mcp_version="1.0",
+                  token_budget: int = None) -> str:
     """Build MCP context with pruning rules."""
-    # Prune tool_output to last 10 bullets, collapse older into "+N more…"
-    pruned_tool_output = tool_output.copy()
-    if len(pruned_tool_output) > 10:
-        excess_count = len(pruned_tool_output) - 9
-        pruned_tool_output = [f"+{excess_count} more…"] + pruned_tool_output[-9:]
-    
-    # Prune history to last 2 turns
-    pruned_history = history[-2:] if len(history) > 2 else history
+    # Keep the most important bullets that fit the token budget, collapse the rest into "+N more…"
+    pruned_tool_output = pack_bullets(tool_output, token_budget)
     
     ctx = {
         "mcp_version": mcp_version,
         "system": system,
         "tool_output": pruned_tool_output,
-        "history": pruned_history
+        "history": prune_history(history)
     }
     return json.dumps(ctx)
 
 
-def run_agent_single(plan_path: str, user_reply: str = None, temperature: float = 0) -> str:
-    """Run the agent with MCP protocol."""
+def prune_history(history: List[dict]) -> List[dict]:
+    """Keep the last 2 turns of history."""
+    return history[-2:] if len(history) > 2 else history
+
+
+def plan_message(tool_output: List[str], mcp_version="1.0", token_budget: int = None) -> dict:
+    """The message carrying a plan's tool_output, packed into the token budget, as MCP context JSON."""
+    ctx = {
+        "mcp_version": mcp_version,
+        "tool_output": pack_bullets(tool_output, token_budget)
+    }
+    return {"role": "user", "content": json.dumps(ctx)}
+
+
+def build_messages(system: str, tool_output: List[str], history: List[dict], mcp_version="1.0",
+                   token_budget: int = None) -> List[dict]:
+    """
+    Lay out the model's messages from the most to the least stable: the static system
+    prompt, then the plan, then the pruned history. Calls about the same plan (later
+    turns, best-of-N samples) then share a prefix the provider's prompt cache can serve.
+    """
+    return [
+        {"role": "system", "content": system},
+        plan_message(tool_output, mcp_version, token_budget)
+    ] + prune_history(history)
+
+
+def response_cache_for(messages: List[dict], temperature: float, n: int = 1):
+    """
+    The response cache and key for a request, or (None, None) if it shouldn't be
+    cached: only deterministic requests (temperature 0, one choice) are, so sampling
+    for best-of-N still gets fresh, diverse replies.
+    """
+    cache = default_response_cache() if temperature == 0 and n == 1 else None
+    if cache is None:
+        return None, None
+    return cache, ResponseCache.key(MODEL, temperature, messages, n)
+
+
+def _choices(response, n: int) -> List[str]:
+    return [response.choices[i].message.content for i in range(n)]
+
+
+def _store(cache, key: str, choices: List[str]) -> None:
+    # Refusals and tool calls come back without text; those aren't worth replaying
+    if cache is not None and all(isinstance(choice, str) for choice in choices):
+        cache.put(key, choices)
+
+
+def _create(client: OpenAI, messages: List[dict], temperature: float, n: int = 1):
+    extra = {"n": n} if n != 1 else {}
+    return client.chat.completions.create(model=MODEL, messages=messages, temperature=temperature, **extra)
+
+
+def complete(client: OpenAI, messages: List[dict], temperature: float = 0, n: int = 1,
+             key_messages: List[dict] = None) -> List[str]:
+    """
+    Get the model's n replies to messages, from the response cache when possible.
+    key_messages, if given, key the cache instead, e.g. with the plan replaced by its
+    fingerprint (see fingerprint_message).
+    """
+    cache, key = response_cache_for(key_messages or messages, temperature, n)
+    choices = cache.get(key) if cache is not None else None
+    if choices is None:
+        choices = _choices(_create(client, messages, temperature, n), n)
+        _store(cache, key, choices)
+    return choices
+
+
+async def acomplete(client: AsyncOpenAI, messages: List[dict], temperature: float = 0, n: int = 1,
+                    key_messages: List[dict] = None) -> List[str]:
+    """Like complete, with an AsyncOpenAI client."""
+    cache, key = response_cache_for(key_messages or messages, temperature, n)
+    choices = cache.get(key) if cache is not None else None
+    if choices is None:
+        choices = _choices(await _create(client, messages, temperature, n), n)
+        _store(cache, key, choices)
+    return choices
+
+
+def fingerprint_message(fingerprint: str) -> dict:
+    """Stands in for the plan message in cache keys, so cosmetically different plans share replies."""
+    return {"role": "user", "content": json.dumps({"plan_fingerprint": fingerprint})}
+
+
+def explanation_fingerprint(resource_changes, temperature: float = 0, report=None) -> str | None:
+    """
+    The plan fingerprint keying cached explanations, or None if they aren't cached.
+    With report, a stream like sys.stderr, it is always computed and written there,
+    so cache hit rates can be audited.
+    """
+    if report is None and (temperature != 0 or default_response_cache() is None):
+        return None
+    fingerprint = plan_fingerprint(resource_changes)
+    if report is not None:
+        print(f"plan_fingerprint: {fingerprint}", file=report)
+    return fingerprint
+
+
+def describe_change(change, with_details: bool = True, attributes: bool = True) -> str:
+    """Render one resource change as a tool_output bullet; without attributes only deltas are shown."""
+    action = summarize_actions(change.change.actions)
+    
+    # Include basic info
+    line = f"- {action} {change.address}"
+    
+    # Add configuration details if available; this is what decodes the attributes
+    if with_details and attributes:
+        details = change_details(change)
+        if details:
+            line += f" ({', '.join(f'{label}: {value}' for label, value in details)})"
+    
+    # Updates list what actually changes, a few tokens per delta
+    if with_details and change.change.deltas:
+        line += f" [{describe_deltas(change.change.deltas)}]"
+    
+    return line
+
+
+def change_details(change) -> List[Tuple[str, str]]:
+    """The (label, value) pairs of meaningful configuration fields a bullet shows for a change."""
+    after = change.change.after if hasattr(change.change, 'after') else None
+    if not after:
+        return []
+    return [(label, f"{after[key]}{unit}") for key, label, unit in DETAIL_FIELDS if key in after and after[key]]
+
+
+def describe_family(changes, with_details: bool = True, attributes: bool = True) -> str:
+    """
+    Render count/for_each instances of one resource with the same action as a single
+    bullet, e.g. "- create aws_instance.web[0..199] (type: t2.micro) ×200"; details
+    that differ between the instances are shown as ranges or lists of values.
+    """
+    action = summarize_actions(changes[0].change.actions)
+    line = f"- {action} {family_address([change.address for change in changes])}"
+    
+    if with_details and attributes:
+        details = merge_details([change_details(change) for change in changes])
+        if details:
+            line += f" ({', '.join(details)})"
+    
+    if with_details:
+        deltas = [describe_deltas(change.change.deltas) for change in changes if change.change.deltas]
+        if deltas:
+            line += f" [{merge_values(deltas)}]"
+    
+    return f"{line} ×{len(changes)}"
+
+
+def describe_deltas(deltas) -> str:
+    """Render structured deltas compactly, e.g. "~instance_type: t2.micro -> t2.large, +tags.Env=prod"."""
+    parts = []
+    for delta in deltas:
+        if delta.op == '#':
+            parts.append(f"{delta.path}: {delta.after}" if delta.path else delta.after)
+        elif delta.op == '+':
+            parts.append(f"+{delta.path}={delta.after}")
+        elif delta.op == '-':
+            parts.append(f"-{delta.path}={delta.before}")
+        elif delta.before is None:
+            parts.append(f"~{delta.path}={delta.after}")
+        else:
+            parts.append(f"~{delta.path}: {delta.before} -> {delta.after}")
+    return ", ".join(parts)
+
+
+def count_only_summary(total: int) -> str:
+    """The single-line answer to a "Count only" request."""
+    return f"Summary: {total} change{'' if total == 1 else 's'}"
+
+
+def run_agent_single(plan_path: str, user_reply: str = None, temperature: float = 0, report=None) -> str:
+    """Run the agent with MCP protocol; report gets the plan fingerprint, see explanation_fingerprint."""
+    # A count-only answer comes from the plan's summary line, without parsing resources, scanning
+    # headers or calling the model
+    if user_reply == "Count only":
+        return count_only_summary(count_plan_changes(plan_path, verify=False).total)
+    
     # Load and bulletize changes with details
-    resource_changes = load_plan(plan_path)
-    tool_output = []
-    for change in resource_changes:
-        actions = change.change.actions
-        action = actions[0] if actions else "no-op"
-        
-        # Include basic info
-        line = f"- {action} {change.address}"
-        
-        # Add configuration details if available
-        if hasattr(change.change, 'after') and change.change.after:
-            after = change.change.after
-            details = []
-            
-            # Extract common meaningful fields
-            if isinstance(after, dict):
-                if 'name' in after and after['name']:
-                    details.append(f"name: {after['name']}")
-                if 'display_name' in after and after['display_name']:
-                    details.append(f"display_name: {after['display_name']}")
-                if 'instance_type' in after and after['instance_type']:
-                    details.append(f"type: {after['instance_type']}")
-                if 'memory_size_gb' in after and after['memory_size_gb']:
-                    details.append(f"memory: {after['memory_size_gb']}GB")
-                if 'region' in after and after['region']:
-                    details.append(f"region: {after['region']}")
-                if 'location_id' in after and after['location_id']:
-                    details.append(f"location: {after['location_id']}")
-                if 'tier' in after and after['tier']:
-                    details.append(f"tier: {after['tier']}")
-                if 'redis_version' in after and after['redis_version']:
-                    details.append(f"version: {after['redis_version']}")
-                
-            if details:
-                line += f" ({', '.join(details)})"
-        
-        tool_output.append(line)
+    resource_changes = load_plan_table_cached(plan_path)
+    fingerprint = explanation_fingerprint(resource_changes, temperature, report)
+    return explain_resource_changes(resource_changes, user_reply, temperature, fingerprint=fingerprint)
+
+
+def render_tool_output(resource_changes, token_budget: int = None, attributes: bool = True) -> List[str]:
+    """
+    Render the tool_output bullets that fit the token budget, most important first;
+    see pack_tool_output. Instances of a count/for_each resource with the same action
+    share one bullet (describe_family). Bullets are only rendered for the changes
+    that are considered, so the attributes of the rest are never decoded. A PlanTable
+    is ranked and grouped from its columns and addresses.
+    """
+    if isinstance(resource_changes, PlanTable):
+        def action(i):
+            return resource_changes.value('action', i)
+
+        def resource_type(i):
+            return resource_changes.value('type', i)
+
+        def address(i):
+            return resource_changes.address(i)
+    else:
+        def action(i):
+            return summarize_actions(resource_changes[i].change.actions)
+
+        def resource_type(i):
+            return resource_changes[i].type
+
+        def address(i):
+            return resource_changes[i].address
     
-    # First turn: history = []
-    history = []
+    indexes = range(len(resource_changes))
+    families = instance_families(map(address, indexes), map(action, indexes))
     
-    # Build context JSON
-    context_json = build_context(BOT_PROMPT, tool_output, history)
+    def render(family, with_details):
+        if len(families[family]) == 1:
+            return describe_change(resource_changes[families[family][0]], with_details, attributes)
+        return describe_family([resource_changes[i] for i in families[family]], with_details, attributes)
     
-    # Call OpenAI API
-    client = OpenAI()
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "system", "content": context_json}],
-        temperature=temperature
+    return pack_tool_output(
+        len(families),
+        priority=lambda family: change_priority(action(families[family][0]), resource_type(families[family][0])),
+        action=lambda family: action(families[family][0]),
+        render=render,
+        budget=token_budget,
+        weight=lambda family: len(families[family])
     )
+
+
+def explain_resource_changes(resource_changes, user_reply: str = None, temperature: float = 0,
+                             interactive: bool = True, token_budget: int = None, client: OpenAI = None,
+                             fingerprint: str = None) -> str:
+    """
+    Explain parsed resource changes with the model, answering its "Count only or
+    full summary?" question with user_reply, or with a line read from stdin when
+    interactive. Otherwise the question itself is returned.
+
+    Plans of more than MAP_REDUCE_MIN_CHANGES changes get a full summary from
+    explain_map_reduce instead, after the same question is answered.
+
+    Replies are cached under the plan's fingerprint, so a plan differing only
+    cosmetically from one explained before is answered without a request.
+    """
+    fingerprint = fingerprint or explanation_fingerprint(resource_changes, temperature)
+    if len(resource_changes) > MAP_REDUCE_MIN_CHANGES:
+        if user_reply is None:
+            if not interactive:
+                return "Count only or full summary?"
+            user_reply = input().strip()
+        if user_reply == "Count only":
+            return count_only_summary(len(resource_changes))
+        return explain_map_reduce(resource_changes, user_reply, temperature, client=client, fingerprint=fingerprint)
+    
+    tool_output = render_tool_output(resource_changes, token_budget)
+    return explain_tool_output(tool_output, user_reply, temperature, interactive, client=client,
+                               total=len(resource_changes), token_budget=token_budget, fingerprint=fingerprint)
+
+
+def partition_changes(resource_changes, by: str = 'module',
+                      size: int = MAP_PARTITION_CHANGES) -> List[Tuple[str, List[int]]]:
+    """
+    Split changes into (name, indexes) parts of at most size changes, grouped by
+    'module' or resource 'type'. Large groups are split and small ones merged, in plan
+    order, so the number of parts follows the plan size divided by size.
+    """
+    if isinstance(resource_changes, PlanTable):
+        groups = {name: list(rows) for name, rows in resource_changes.group_by(by).items()}
+    else:
+        groups = {}
+        for i, change in enumerate(resource_changes):
+            key = module_path(change.address) if by == 'module' else change.type
+            groups.setdefault(key, []).append(i)
+    
+    parts: List[Tuple[List[str], List[int]]] = []
+    for name, rows in groups.items():
+        for start in range(0, len(rows), size):
+            chunk = rows[start:start + size]
+            if parts and len(parts[-1][1]) + len(chunk) <= size:
+                parts[-1][0].append(name)
+                parts[-1][1].extend(chunk)
+            else:
+                parts.append(([name], list(chunk)))
+    return [(", ".join(name or "root module" for name in names), rows) for names, rows in parts]
+
+
+def summarize_partition(client: OpenAI, name: str, resource_changes, temperature: float = 0,
+                        token_budget: int = None) -> str:
+    """Map step: summarize the changes of one part of a plan."""
+    tool_output = [f"Part: {name}"] + render_tool_output(resource_changes, token_budget)
+    messages = build_messages(MAP_PROMPT, tool_output, [], token_budget=token_budget)
+    return complete(client, messages, temperature)[0]
+
+
+def explain_map_reduce(resource_changes, user_reply: str = "Full summary", temperature: float = 0,
+                       by: str = 'module', max_workers: int = MAP_WORKERS, token_budget: int = None,
+                       client: OpenAI = None, fingerprint: str = None) -> str:
+    """
+    Summarize a plan too large for one prompt: summarize each part of it (see
+    partition_changes) concurrently, at most max_workers at a time, then merge the
+    partial summaries in a final call. The exact number of changes, and their counts
+    by action, come from the parser, not from the parts.
+
+    With the plan's fingerprint, a summary cached for it skips every call.
+    """
+    conversation = [
+        {"role": "assistant", "content": "Count only or full summary?"},
+        {"role": "user", "content": user_reply or "Full summary"}
+    ]
+    cache, key = None, None
+    if fingerprint is not None:
+        cache, key = response_cache_for([{"role": "system", "content": BOT_PROMPT}, fingerprint_message(fingerprint)]
+                                        + conversation, temperature)
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            return cached[0]
     
-    assistant_reply = response.choices[0].message.content
+    client = client or OpenAI()
+    parts = partition_changes(resource_changes, by)
+    
+    def summarize(part):
+        name, rows = part
+        return summarize_partition(client, name, [resource_changes[i] for i in rows], temperature, token_budget)
+    
+    # The model calls dominate, so threads are enough to overlap them
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(parts)))) as executor:
+        summaries = list(executor.map(summarize, parts))
+    
+    if isinstance(resource_changes, PlanTable):
+        counts = resource_changes.counts('action')
+    else:
+        counts = dict(Counter(summarize_actions(change.change.actions) for change in resource_changes))
+    reduce_input = {
+        "mcp_version": "1.0",
+        "total_changes": len(resource_changes),
+        "changes_by_action": counts,
+        "partial_summaries": [
+            {"part": name, "changes": len(rows), "summary": summary}
+            for (name, rows), summary in zip(parts, summaries)
+        ]
+    }
+    # Reduce step: the usual conversation, over the partial summaries instead of the bullets
+    messages = [
+        {"role": "system", "content": BOT_PROMPT},
+        {"role": "user", "content": json.dumps(reduce_input)}
+    ] + conversation
+    if cache is None:
+        return complete(client, messages, temperature)[0]
+    choices = _choices(_create(client, messages, temperature), 1)
+    _store(cache, key, choices)
+    return choices[0]
+
+
+def explain_tool_output(tool_output: List[str], user_reply: str = None, temperature: float = 0,
+                        interactive: bool = True, client: OpenAI = None, total: int = None,
+                        token_budget: int = None, fingerprint: str = None) -> str:
+    """
+    Run the conversation over already rendered tool_output bullets. total is the
+    number of changes, when the bullets don't have one each; fingerprint is the
+    plan's, to key cached replies on.
+    """
+    # The system prompt and plan messages are built once and reused by every turn
+    conversation = Conversation(tool_output, total, token_budget=token_budget, client=client or OpenAI(),
+                                temperature=temperature, fingerprint=fingerprint)
+    assistant_reply = conversation.send()
     
     # Check if model asks for count only or full summary
     if "Count only or full summary?" in assistant_reply:
         # Use provided user_reply or read from input
         if user_reply is None:
+            if not interactive:
+                return assistant_reply
             user_reply = input().strip()
+            if user_reply == "Count only":
+                return count_only_summary(conversation.total)
         
-        # Append to history
-        history.append({"role": "user", "content": user_reply})
-        history.append({"role": "assistant", "content": assistant_reply})
-        
-        # Rebuild context with updated history
-        context_json = build_context(BOT_PROMPT, tool_output, history)
-        
-        # Second API call
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": context_json}],
-            temperature=temperature
-        )
-        
-        return response.choices[0].message.content
+        # Second API call, after the same prefix
+        return conversation.send(user_reply)
     
     return assistant_reply
 
 
-def run_agent_best_of_n(plan_path: str, n: int = 3, user_reply: str = None, temperature: float = 0.7) -> Tuple[str, float, List[Tuple[str, float]]]:
+class Conversation:
+    """
+    A multi-turn conversation about one plan. The system prompt and plan messages
+    are built once and open every request unchanged; each turn then only adds the
+    new user message to the pruned history kept here.
+
+    With the plan's fingerprint, replies are cached under it rather than under the
+    plan message, so they are shared by cosmetically different copies of the plan.
     """
-    Run agent N times and return the best response according to the reward function.
     
-    Args:
-        plan_path: Path to the Terraform plan
-        n: Number of responses to generate
-        user_reply: User reply for multi-turn (None for interactive)
-        temperature: Temperature for API calls
+    def __init__(self, tool_output: List[str], total: int = None, plan=None, token_budget: int = None,
+                 client: OpenAI = None, temperature: float = 0, fingerprint: str = None):
+        # The parsed plan, for follow-ups that need more than the bullets
+        self.plan = plan
+        self.total = len(tool_output) if total is None else total
+        self.prefix = build_messages(BOT_PROMPT, tool_output, [], token_budget=token_budget)
+        self.history: List[dict] = []
+        self.client = client
+        self.temperature = temperature
+        self.fingerprint = fingerprint
+        # One turn at a time, also when a session is shared
+        self._lock = threading.Lock()
     
-    Returns:
-        Tuple of (best_response, best_score, all_responses_with_scores)
+    def send(self, content: str = None) -> str:
+        """Send a user message (None for the opening turn) and return the model's reply."""
+        with self._lock:
+            history = self._history_with(content)
+            reply = complete(self.client or OpenAI(), self.prefix + prune_history(history), self.temperature,
+                             key_messages=self._key_messages(history))[0]
+            return self._record(history, reply)
+    
+    async def asend(self, content: str = None) -> str:
+        """Like send, with an AsyncOpenAI client; turns of one conversation must not overlap."""
+        history = self._history_with(content)
+        reply = (await acomplete(self.client, self.prefix + prune_history(history), self.temperature,
+                                 key_messages=self._key_messages(history)))[0]
+        return self._record(history, reply)
+    
+    async def asend_choices(self, n: int, content: str = None) -> List[str]:
+        """
+        Like asend, but get n alternative replies from a single request (the API's n);
+        the history is left as it was, see branch.
+        """
+        return await acomplete(self.client, self.prefix + prune_history(self._history_with(content)),
+                               self.temperature, n)
+    
+    def branch(self, content: str = None, reply: str = None) -> 'Conversation':
+        """A copy of the conversation continuing with one turn of asend_choices, e.g. its reply."""
+        branch = copy.copy(self)
+        branch.history = self.history
+        if reply is not None:
+            branch._record(self._history_with(content), reply)
+        branch._lock = threading.Lock()
+        return branch
+    
+    def _key_messages(self, history: List[dict]) -> List[dict] | None:
+        if self.fingerprint is None:
+            return None
+        return [self.prefix[0], fingerprint_message(self.fingerprint)] + prune_history(history)
+    
+    def _history_with(self, content: str | None) -> List[dict]:
+        return self.history + ([{"role": "user", "content": content}] if content is not None else [])
+    
+    def _record(self, history: List[dict], reply: str) -> str:
+        self.history = prune_history(history + [{"role": "assistant", "content": reply}])
+        return reply
+
+
+def warm_up_client(client: OpenAI) -> threading.Thread:
     """
-    # Create spec for scoring
-    spec = {
-        "plan": plan_path,
-        "user_reply": user_reply
-    }
+    Open the client's connection to the API in the background, so the first real
+    request after it doesn't pay for DNS, TCP and TLS setup. Failures are ignored;
+    the real request will report them.
+    """
+    def warm_up():
+        try:
+            # with_options copies share the client's connection pool
+            client.with_options(max_retries=0, timeout=WARM_UP_TIMEOUT).models.list()
+        except Exception:
+            pass
+    
+    thread = threading.Thread(target=warm_up, daemon=True)
+    thread.start()
+    return thread
+
+
+def run_agent_stream(stream, user_reply: str = None, temperature: float = 0, report=None) -> str:
+    """
+    Run the agent on a plan arriving over a pipe, e.g. `terraform plan | python agent.py`.
+    
+    Resources are parsed as their lines arrive, while the API connection is warmed
+    up, so once the plan ends only rendering the bullets that fit the context and
+    the model round-trip remain. report gets the plan fingerprint, see
+    explanation_fingerprint.
+    """
+    client = None
+    if user_reply != "Count only":
+        client = OpenAI()
+        warm_up_client(client)
+    
+    resource_changes = list(iter_resource_changes_stream(stream))
+    
+    if user_reply == "Count only":
+        return count_only_summary(len(resource_changes))
+    fingerprint = explanation_fingerprint(resource_changes, temperature, report)
+    return explain_resource_changes(resource_changes, user_reply, temperature, client=client, fingerprint=fingerprint)
+
+
+def explain_plan_text(plan_text: str, user_reply: str = None, temperature: float = 0, report=None) -> str:
+    """Explain plan output held in memory, without asking for input; report as in run_agent_single."""
+    if user_reply == "Count only":
+        return count_only_summary(count_changes(plan_text).total)
+    resource_changes = parse_plan_table_cached(plan_text)
+    if not resource_changes:
+        return "No changes found"
+    fingerprint = explanation_fingerprint(resource_changes, temperature, report)
+    return explain_resource_changes(resource_changes, user_reply, temperature, interactive=False,
+                                    fingerprint=fingerprint)
+
+
+def run_agent_projects(plan_text: str, user_reply: str = None, temperature: float = 0,
+                       max_workers: int = PROJECT_WORKERS, report=None,
+                       interactive: bool = False) -> List[Tuple[PlanSection, str]]:
+    """
+    Split Atlantis output into projects and explain each one concurrently.
+
+    Returns (section, explanation) pairs in the order the projects appear. The model
+    calls dominate, so threads are enough to overlap them. Projects with the same
+    plan fingerprint, like one module planned for identical workspaces, are explained
+    once; report gets each project's fingerprint.
+
+    Without user_reply, when interactive and any project has enough changes for the
+    "Count only or full summary?" question, a line is read from stdin once, before
+    fanning out, and answers it for every project.
+    """
+    sections = split_projects(plan_text)
+    tables = None
+    if user_reply is None and interactive:
+        tables = [parse_plan_table_cached(section.text) for section in sections]
+        if any(len(table) > QUESTION_MIN_CHANGES for table in tables):
+            user_reply = input().strip()
+    if len(sections) == 1 or user_reply == "Count only":
+        return [(section, explain_plan_text(section.text, user_reply, temperature, report)) for section in sections]
+    
+    if tables is None:
+        tables = [parse_plan_table_cached(section.text) for section in sections]
+    fingerprints = [plan_fingerprint(table) for table in tables]
+    if report is not None:
+        for section, fingerprint in zip(sections, fingerprints):
+            print(f"plan_fingerprint: {fingerprint}" + (f" ({section.heading})" if section.heading else ""),
+                  file=report)
+    
+    def explain(fingerprint, table):
+        if not table:
+            return "No changes found"
+        return explain_resource_changes(table, user_reply, temperature, interactive=False, fingerprint=fingerprint)
+    
+    distinct = dict(zip(fingerprints, tables))
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(distinct))) as executor:
+        explanations = dict(zip(distinct, executor.map(explain, distinct, distinct.values())))
+    return [(section, explanations[fingerprint]) for section, fingerprint in zip(sections, fingerprints)]
+
+
+def format_project_results(results: List[Tuple[PlanSection, str]]) -> str:
+    """Join per-project explanations into one response, headed by each project's Atlantis heading."""
+    if len(results) == 1 and not results[0][0].heading:
+        return results[0][1]
+    return "\n\n".join(f"### {section.heading}\n{explanation}" for section, explanation in results)
+
+
+class PreparedPlan(NamedTuple):
+    """
+    A plan loaded, counted and rendered once, to be explained several times (e.g. by
+    best-of-N samples). resource_changes is None for "Count only", and conversation,
+    holding the rendered prefix, is None then and for plans explained by map-reduce.
+    """
+    total: int
+    resource_changes: PlanTable | None
+    conversation: 'Conversation | None'
+
+
+def prepare_plan(plan_path: str, user_reply: str = None, temperature: float = 0,
+                 client: AsyncOpenAI = None) -> PreparedPlan:
+    """Load and render a plan for explain_prepared; blocking, so run it in a thread from async code."""
+    if user_reply == "Count only":
+        return PreparedPlan(count_plan_changes(plan_path, verify=False).total, None, None)
+    
+    resource_changes = load_plan_table_cached(plan_path)
+    if len(resource_changes) > MAP_REDUCE_MIN_CHANGES:
+        return PreparedPlan(len(resource_changes), resource_changes, None)
+    conversation = Conversation(render_tool_output(resource_changes), len(resource_changes), client=client,
+                                temperature=temperature,
+                                fingerprint=explanation_fingerprint(resource_changes, temperature))
+    return PreparedPlan(len(resource_changes), resource_changes, conversation)
+
+
+async def explain_prepared(plan: PreparedPlan, user_reply: str = None, temperature: float = 0) -> str:
+    """
+    Explain a prepared plan as run_agent_single_async would. Each call continues its
+    own branch of the shared conversation, so calls can run at once.
+    """
+    if plan.resource_changes is None:
+        return count_only_summary(plan.total)
+    if plan.conversation is None:
+        # Map-reduce runs its own pool of calls
+        return await asyncio.to_thread(explain_resource_changes, plan.resource_changes, user_reply, temperature, False)
+    
+    conversation = plan.conversation.branch()
+    conversation.client = conversation.client or AsyncOpenAI()
+    assistant_reply = await conversation.asend()
+    if "Count only or full summary?" in assistant_reply and user_reply is not None:
+        return await conversation.asend(user_reply)
+    return assistant_reply
+
+
+async def run_agent_single_async(plan_path: str, user_reply: str = None, temperature: float = 0,
+                                 client: AsyncOpenAI = None) -> str:
+    """
+    Like run_agent_single with an AsyncOpenAI client, so several can run at once.
+    Without user_reply, the model's question is returned instead of asking for input.
+    """
+    plan = await asyncio.to_thread(prepare_plan, plan_path, user_reply, temperature, client)
+    return await explain_prepared(plan, user_reply, temperature)
+
+
+async def sample_choices(plan_path: str, n: int, user_reply: str = None, temperature: float = 0.7,
+                         client: AsyncOpenAI = None, plan: PreparedPlan = None) -> List[str]:
+    """
+    Get n responses for a plan from one completion request with n choices, so the
+    prompt is uploaded once. Choices that ask "Count only or full summary?" are
+    answered with user_reply, again with one request (and n) per distinct question.
+    plan is the plan already prepared, if it was.
+    """
+    if plan is None:
+        plan = await asyncio.to_thread(prepare_plan, plan_path, user_reply, temperature, client)
+    if plan.resource_changes is None:
+        return [count_only_summary(plan.total)] * n
+    if plan.conversation is None:
+        # Map-reduce makes its own calls for each sample
+        return list(await asyncio.gather(*(explain_prepared(plan, user_reply, temperature) for _ in range(n))))
+    
+    conversation = plan.conversation.branch()
+    conversation.client = conversation.client or AsyncOpenAI()
+    replies = await conversation.asend_choices(n)
+    if user_reply is None:
+        return replies
+    
+    # Branches asking the same question share their second request too
+    questions = [reply for reply in dict.fromkeys(replies) if "Count only or full summary?" in reply]
+    answers = await asyncio.gather(*(
+        conversation.branch(reply=question).asend_choices(replies.count(question), user_reply)
+        for question in questions
+    ))
+    pending = {question: iter(choices) for question, choices in zip(questions, answers)}
+    return [next(pending[reply]) if reply in pending else reply for reply in replies]
+
+
+async def run_agent_best_of_n_async(plan_path: str, n: int = 3, user_reply: str = None, temperature: float = 0.7,
+                                    max_concurrency: int = None, client: AsyncOpenAI = None,
+                                    strategy: str = "concurrent", target_score: float = None, min_samples: int = 1,
+                                    deadline: float = None) -> Tuple[str, float, List[Tuple[str, float]]]:
+    """
+    Generate N responses, score them and return them like run_agent_best_of_n.
     
-    responses_with_scores = []
+    Strategies:
+        concurrent: N samples at once, at most max_concurrency (default
+            BEST_OF_N_CONCURRENCY) at a time, each scored as it completes; the
+            wall-clock time is about that of the slowest sample.
+        choices: all N from one request with the API's n parameter (sample_choices),
+            paying for the prompt once.
+        early_exit: like concurrent, at most EARLY_EXIT_CONCURRENCY at a time by
+            default, but once a response scores target_score (default 100) the
+            samples in flight are cancelled and no more are started.
     
-    # Generate N responses
-    for i in range(n):
+    Sampling also stops, for concurrent and early_exit, at deadline seconds; the
+    samples done by then are returned. It never stops before min_samples are done,
+    other than at the deadline.
+    """
+    if strategy not in ("concurrent", "choices", "early_exit"):
+        raise ValueError(f"unknown best-of-N strategy {strategy!r}")
+    if strategy == "early_exit":
+        target_score = EARLY_EXIT_SCORE if target_score is None else target_score
+        max_concurrency = max_concurrency or EARLY_EXIT_CONCURRENCY
+    # One client, and one connection pool, for all samples; without it (e.g. no API key)
+    # each sample reports the error, as it would on its own
+    owned = client is None
+    if owned:
+        try:
+            client = AsyncOpenAI()
+        except Exception:
+            client = None
+    
+    try:
+        # Loaded, rendered and counted once for all samples, off the event loop
         try:
-            response = run_agent_single(plan_path, user_reply, temperature)
-            response_score = score(response, spec)
-            responses_with_scores.append((response, response_score))
-            print(f"Response {i+1}/{n}: Score {response_score}/100")
+            plan = await asyncio.to_thread(prepare_plan, plan_path, user_reply, temperature, client)
         except Exception as e:
-            print(f"Error generating response {i+1}: {e}")
-            responses_with_scores.append((f"Error: {e}", 0.0))
+            print(f"Error loading plan: {e}")
+            return f"Error: {e}", 0.0, [(f"Error: {e}", 0.0)] * n
+        # The reward's expected count, so scoring doesn't count the plan again
+        spec = {
+            "plan": plan_path,
+            "user_reply": user_reply,
+            "count": plan.total
+        }
+        
+        if strategy == "choices":
+            try:
+                responses = await sample_choices(plan_path, n, user_reply, temperature, client, plan)
+            except Exception as e:
+                print(f"Error generating responses: {e}")
+                responses = [f"Error: {e}"] * n
+            responses_with_scores = []
+            for i, response in enumerate(responses):
+                responses_with_scores.append((response, 0.0 if response.startswith("Error: ") else score(response, spec)))
+                print(f"Response {i+1}/{n}: Score {responses_with_scores[-1][1]}/100")
+        else:
+            responses_with_scores = await _sample_concurrently(
+                plan, n, user_reply, temperature, spec,
+                max_concurrency or BEST_OF_N_CONCURRENCY, target_score, min_samples, deadline
+            )
+    finally:
+        if owned and client is not None:
+            await client.close()
+    
+    if not responses_with_scores:
+        return f"Error: no response within the {deadline}s deadline", 0.0, []
     
     # Sort by score (highest first) and return the best
     responses_with_scores.sort(key=lambda x: x[1], reverse=True)
@@ -172,6 +816,90 @@ def run_agent_best_of_n(plan_path: str, n: int = 3, user_reply: str = None, temp
     return best_response, best_score, responses_with_scores
 
 
+async def _sample_concurrently(plan: PreparedPlan, n: int, user_reply: str, temperature: float, spec: dict,
+                               max_concurrency: int, target_score: float = None, min_samples: int = 1,
+                               deadline: float = None) -> List[Tuple[str, float]]:
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    # Set once target_score is met, before the next sample can take the freed slot
+    stop = asyncio.Event()
+    scores = []
+    
+    async def sample(i: int) -> Tuple[int, Tuple[str, float] | None]:
+        async with semaphore:
+            if stop.is_set():
+                return i, None
+            try:
+                response = await explain_prepared(plan, user_reply, temperature)
+                result = (response, score(response, spec))
+            except Exception as e:
+                result = (f"Error: {e}", 0.0)
+            scores.append(result[1])
+            if target_score is not None and len(scores) >= min_samples and max(scores) >= target_score:
+                stop.set()
+            return i, result
+    
+    loop = asyncio.get_running_loop()
+    stop_at = None if deadline is None else loop.time() + deadline
+    tasks = [asyncio.create_task(sample(i)) for i in range(n)]
+    results = {}
+    try:
+        pending = set(tasks)
+        while pending:
+            timeout = None if stop_at is None else max(0, stop_at - loop.time())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"Deadline reached after {len(results)}/{n} responses")
+                break
+            for task in done:
+                i, result = task.result()
+                if result is None:
+                    continue
+                results[i] = result
+                response, response_score = result
+                if response.startswith("Error: "):
+                    print(f"Error generating response {i+1}: {response[len('Error: '):]}")
+                else:
+                    print(f"Response {i+1}/{n}: Score {response_score}/100")
+            if stop.is_set():
+                break
+    finally:
+        # Samples still waiting for a slot are never started; those in flight are cancelled
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return [results[i] for i in sorted(results)]
+
+
+def run_agent_best_of_n(plan_path: str, n: int = 3, user_reply: str = None, temperature: float = 0.7,
+                        max_concurrency: int = None, strategy: str = "concurrent", target_score: float = None,
+                        min_samples: int = 1, deadline: float = None) -> Tuple[str, float, List[Tuple[str, float]]]:
+    """
+    Run agent N times and return the best response according to the reward function.
+    
+    The N samples run concurrently (see run_agent_best_of_n_async); from a running
+    event loop, await that instead.
+    
+    Args:
+        plan_path: Path to the Terraform plan
+        n: Number of responses to generate
+        user_reply: User reply for multi-turn (None returns the model's question)
+        temperature: Temperature for API calls
+        max_concurrency: Most samples in flight at once
+        strategy: "concurrent" (N requests), "choices" (one request with n choices)
+            or "early_exit" (stop at target_score)
+        target_score: Stop sampling once a response scores this
+        min_samples: Responses to wait for before stopping at target_score
+        deadline: Seconds after which sampling stops with the responses so far
+    
+    Returns:
+        Tuple of (best_response, best_score, all_responses_with_scores)
+    """
+    return asyncio.run(run_agent_best_of_n_async(
+        plan_path, n, user_reply, temperature, max_concurrency, strategy=strategy, target_score=target_score,
+        min_samples=min_samples, deadline=deadline
+    ))
+
+
 def run_agent(plan_path: str) -> str:
     """Legacy wrapper for backward compatibility."""
     return run_agent_single(plan_path)
@@ -185,5 +913,18 @@ if __name__ == "__main__":
     else:
         plan_path = sys.argv[1]
     
-    result = run_agent(plan_path)
+    # Atlantis comments may bundle several projects; explain them side by side.
+    # gzip, xz and zstd plans are decompressed as they are read
+    plan = open_plan_binary(plan_path)
+    if is_atlantis_comment(plan.peek(1024)[:1024]):
+        with io.TextIOWrapper(plan, encoding="utf-8", errors="replace") as f:
+            plan_text = f.read()
+        result = format_project_results(run_agent_projects(plan_text, report=sys.stderr, interactive=True))
+    elif plan_path == "-":
+        # Parse while terraform is still writing the plan
+        result = run_agent_stream(io.TextIOWrapper(plan, encoding="utf-8", errors="replace"), report=sys.stderr)
+    else:
+        plan.close()
+        result = run_agent_single(plan_path, report=sys.stderr)
+    # The plan fingerprints went to stderr, so stdout is only the explanation
     print(result)
\ No newline at end of file
@@ -0,0 +1,62 @@
+import re
+from typing import List
+
+from pydantic import BaseModel
+
+# Atlantis comments start with this, followed by either a single project or a project count
+ATLANTIS_PREFIX = 'Ran Plan for '
+
+_PROJECT = r'(?:project: `(?P<project>[^`]*)` )?dir: `(?P<dir>[^`]*)` workspace: `(?P<workspace>[^`]*)`'
+# Multi-project comments have one "### N. dir: `...` workspace: `...`" heading per project
+PROJECT_HEADING_RE = re.compile(r'^#{1,4} \d+\. (' + _PROJECT + r')[^\n]*$', re.M)
+# Single-project comments name the project on the first line instead
+SINGLE_PROJECT_RE = re.compile(r'^' + re.escape(ATLANTIS_PREFIX) + r'(' + _PROJECT + r')[^\n]*$', re.M)
+
+
+class PlanSection(BaseModel):
+    """The plan output of one Atlantis project/workspace."""
+    heading: str
+    project: str | None = None
+    dir: str | None = None
+    workspace: str | None = None
+    text: str
+
+    @property
+    def name(self) -> str:
+        return self.project or self.dir or ''
+
+
+def is_atlantis_comment(head) -> bool:
+    """Return True if the start of a plan looks like an Atlantis plan comment."""
+    prefix = ATLANTIS_PREFIX if isinstance(head, str) else ATLANTIS_PREFIX.encode()
+    return head.lstrip().startswith(prefix)
+
+
+def _section(match, text: str) -> PlanSection:
+    return PlanSection(
+        heading=match.group(1),
+        project=match.group('project'),
+        dir=match.group('dir'),
+        workspace=match.group('workspace'),
+        text=text
+    )
+
+
+def split_projects(text: str) -> List[PlanSection]:
+    """
+    Split Atlantis plan output into one section per project/workspace.
+
+    Each section runs from its "### N. dir: ..." heading to the next one, so the
+    Markdown around the plan (details tags, apply instructions) stays in it; the
+    plan parsers ignore those lines. Output that isn't a multi-project comment is
+    returned as a single section, named after the project if Atlantis names one.
+    """
+    headings = list(PROJECT_HEADING_RE.finditer(text))
+    if headings:
+        ends = [match.start() for match in headings[1:]] + [len(text)]
+        return [_section(match, text[match.end():end]) for match, end in zip(headings, ends)]
+
+    single = SINGLE_PROJECT_RE.search(text)
+    if single:
+        return [_section(single, text[single.end():])]
+    return [PlanSection(heading='', text=text)]
@@ -0,0 +1,234 @@
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from tools import split_address
+
+# Tokens of tool_output per context, unless TERRA_AGENT_CONTEXT_TOKENS says otherwise
+DEFAULT_TOKEN_BUDGET = 2000
+# Packing stops once fewer tokens than this are left; no bullet is shorter
+MIN_BULLET_TOKENS = 6
+# Resource types whose destruction loses data
+STATEFUL_TYPE_RE = re.compile(
+    r'_(?:db|rds|database|sql|redis|memcache|memcached|elasticache|dynamodb|bigtable|spanner|firestore|datastore|'
+    r'bucket|s3|storage|volume|disk|ebs|efs|filestore|snapshot|kms|key_ring|crypto_key|secret|kinesis|kafka|msk|'
+    r'opensearch|elasticsearch|docdb|neptune|redshift|table)(?:_|$)'
+)
+# ...unless they are only attached to such a resource
+ATTACHMENT_TYPE_RE = re.compile(r'_(?:iam|policy|acl|notification|attachment|association|lifecycle|versioning)(?:_|$)')
+# tool_output bullets, as rendered by describe_change
+BULLET_RE = re.compile(r'- ([\w-]+) (\S+)')
+# Bullets standing for a family of N instances end in "×N"
+FAMILY_SIZE_RE = re.compile(r' ×(\d+)$')
+# The count/for_each key at the end of a resource address
+INSTANCE_KEY_RE = re.compile(r'\[(\d+|"(?:[^"\\]|\\.)*")\]$')
+# A value's last number, for values that differ only in it, like web-0 ... web-199
+NUMBERED_VALUE_RE = re.compile(r'(.*\D|)(\d+)(\D*)', re.S)
+# Differing values of a family are listed up to this many
+MAX_LISTED_VALUES = 3
+
+
+def token_budget() -> int:
+    """Tokens of tool_output per context: TERRA_AGENT_CONTEXT_TOKENS, or DEFAULT_TOKEN_BUDGET."""
+    return int(os.environ.get('TERRA_AGENT_CONTEXT_TOKENS') or DEFAULT_TOKEN_BUDGET)
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.get_encoding('o200k_base')
+    except (OSError, ValueError):
+        # The encoding can't be downloaded (requests' errors are OSErrors), or its hash is off
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of text for gpt-4o models, with tiktoken if it is installed.
+    Otherwise estimate them at 3 bytes per token, on the high side for plan text.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text.encode('utf-8')) // 3)
+    return len(encoding.encode(text))
+
+
+def bullet_cost(line: str) -> int:
+    """Tokens a bullet adds to the context JSON, with its quotes, escapes and separator."""
+    return count_tokens(json.dumps(line)) + 1
+
+
+def is_stateful_type(resource_type: str) -> bool:
+    """Tell whether resources of a type hold data that destroying them would lose."""
+    return bool(STATEFUL_TYPE_RE.search(resource_type)) and not ATTACHMENT_TYPE_RE.search(resource_type)
+
+
+def change_priority(action: str, resource_type: str) -> int:
+    """Rank a change for the context; lower goes first: stateful destroys and replaces, then other ones, then updates."""
+    stateful = is_stateful_type(resource_type)
+    if action in ('delete', 'replace'):
+        return 0 if stateful else 1
+    if action == 'update':
+        return 2 if stateful else 3
+    return 4
+
+
+def bullet_priority(line: str) -> int:
+    """Rank an already rendered bullet like change_priority; other lines, like "+N more…", go first."""
+    bullet = BULLET_RE.match(line)
+    if bullet is None:
+        return -1
+    return change_priority(bullet.group(1), split_address(bullet.group(2))[0])
+
+
+def pack_tool_output(count: int, priority: Callable[[int], int], action: Callable[[int], str],
+                     render: Callable[[int, bool], str], budget: int | None = None,
+                     weight: Callable[[int], int] | None = None) -> List[str]:
+    """
+    Pick the tool_output bullets of count items that fit a token budget.
+
+    Items are taken most important first (by priority, then plan order). Each is
+    rendered without details first and, only if that fits, again with details,
+    keeping the detailed bullet if it still fits. The bullets come back in plan
+    order, after a "+N more… (N create, ...)" line for the items left out, whose
+    tokens are set aside up front. Packing stops once the budget is spent, so the
+    bullets rendered, and the context, don't grow with the plan.
+
+    weight gives the number of changes an item stands for (1 by default), which is
+    what the "+N more…" line counts.
+    """
+    weight = weight or (lambda index: 1)
+    budget = token_budget() if budget is None else budget
+    reserve = bullet_cost(f"+{count} more… ({count} create, {count} update, {count} delete, {count} replace)")
+    remaining = budget - reserve
+    chosen: Dict[int, str] = {}
+    for index in sorted(range(count), key=lambda i: (priority(i), i)):
+        if remaining < MIN_BULLET_TOKENS:
+            break
+        line = render(index, False)
+        cost = bullet_cost(line)
+        if cost > remaining:
+            continue
+        detailed = render(index, True)
+        if detailed != line:
+            detailed_cost = bullet_cost(detailed)
+            if detailed_cost <= remaining:
+                line, cost = detailed, detailed_cost
+        chosen[index] = line
+        remaining -= cost
+
+    bullets = [chosen[index] for index in sorted(chosen)]
+    if len(chosen) == count:
+        return bullets
+    left_out: Counter = Counter()
+    for index in range(count):
+        if index not in chosen:
+            left_out[action(index)] += weight(index)
+    breakdown = ', '.join(f'{n} {name}' for name, n in left_out.most_common())
+    return [f"+{sum(left_out.values())} more… ({breakdown})"] + bullets
+
+
+def pack_bullets(tool_output: List[str], budget: int | None = None) -> List[str]:
+    """pack_tool_output over already rendered bullets, ranked by bullet_priority."""
+    def action(index: int) -> str:
+        bullet = BULLET_RE.match(tool_output[index])
+        return bullet.group(1) if bullet else 'other'
+
+    return pack_tool_output(
+        len(tool_output),
+        priority=lambda index: bullet_priority(tool_output[index]),
+        action=action,
+        render=lambda index, with_details: tool_output[index],
+        budget=budget,
+        weight=lambda index: bullet_weight(tool_output[index])
+    )
+
+
+def bullet_weight(line: str) -> int:
+    """The number of changes a bullet stands for: N for a "... ×N" family, else 1."""
+    family = FAMILY_SIZE_RE.search(line)
+    return int(family.group(1)) if family else 1
+
+
+def instance_families(addresses: Iterable[str], actions: Iterable[str]) -> List[List[int]]:
+    """
+    Group the indexes of count/for_each instances of the same resource with the same
+    action, e.g. aws_instance.web[0] ... aws_instance.web[199] being created, in order
+    of their first instance. Addresses without an instance key are families of one.
+    """
+    families: Dict[tuple, List[int]] = {}
+    for index, (address, action) in enumerate(zip(addresses, actions)):
+        key = INSTANCE_KEY_RE.search(address)
+        group = (action, address[:key.start()]) if key else (index,)
+        family = families.get(group)
+        if family is None:
+            families[group] = [index]
+        else:
+            family.append(index)
+    return list(families.values())
+
+
+def format_ranges(numbers: Iterable[int]) -> str:
+    """Render integers compactly, e.g. 0..3,7,9..12."""
+    ranges: List[List[int]] = []
+    for number in sorted(set(numbers)):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ','.join(str(first) if first == last else f'{first}..{last}' for first, last in ranges)
+
+
+def family_address(addresses: List[str]) -> str:
+    """The address of a family of instances, e.g. aws_instance.web[0..199] or aws_s3_bucket.logs["a","b",…]."""
+    keys = [INSTANCE_KEY_RE.search(address) for address in addresses]
+    base = addresses[0][:keys[0].start()]
+    values = [key.group(1) for key in keys]
+    if all(value.isdigit() for value in values):
+        return f'{base}[{format_ranges(int(value) for value in values)}]'
+    values = list(dict.fromkeys(values))
+    listed = ','.join(values[:MAX_LISTED_VALUES])
+    return f'{base}[{listed}{",…" if len(values) > MAX_LISTED_VALUES else ""}]'
+
+
+def merge_values(values: List[str]) -> str:
+    """
+    Render the values an attribute takes across a family: the value itself if they
+    are all equal, web-{0..199} if they differ only in a number, else a short list.
+    """
+    distinct = list(dict.fromkeys(values))
+    if len(distinct) == 1:
+        return distinct[0]
+    numbered = [NUMBERED_VALUE_RE.fullmatch(value) for value in distinct]
+    if all(numbered) and len({(match.group(1), match.group(3)) for match in numbered}) == 1:
+        prefix, suffix = numbered[0].group(1), numbered[0].group(3)
+        return f'{prefix}{{{format_ranges(int(match.group(2)) for match in numbered)}}}{suffix}'
+    if len(distinct) <= MAX_LISTED_VALUES:
+        return ' | '.join(distinct)
+    return f'{" | ".join(distinct[:MAX_LISTED_VALUES - 1])} | … ({len(distinct)} values)'
+
+
+def merge_details(details: List[List[Tuple[str, str]]]) -> List[str]:
+    """
+    Merge the (label, value) details of each instance of a family into "label: value"
+    strings, keeping differences only where they exist; labels that only some
+    instances have are marked with how many, like "memory: 4GB (3/10)".
+    """
+    by_label: Dict[str, List[str]] = {}
+    for instance in details:
+        for label, value in instance:
+            by_label.setdefault(label, []).append(value)
+    merged = []
+    for label, values in by_label.items():
+        part = f'{label}: {merge_values(values)}'
+        if len(values) < len(details):
+            part += f' ({len(values)}/{len(details)})'
+        merged.append(part)
+    return merged
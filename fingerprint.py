@@ -0,0 +1,108 @@
+import hashlib
+import json
+import re
+from typing import Iterable
+
+from tools import BlobValue, LazyAttributes, decode_attributes, summarize_actions, text_slice
+
+# Terminal color and style codes, as in `terraform plan` output without -no-color
+ANSI_RE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+
+# Only values that change between runs of the same plan are normalized; names that
+# merely look generated, like logs-20240101 or backup-0badc0de, are left alone. Each
+# pattern starts with literal text, so the regex engine can skip ahead to it.
+_VALUE = r'(?:"(?:[^"\\\0]|\\.)*"|[^\s,}\]\0]+)'
+# The value of an id or arn attribute, as in plan text (also `a -> b`) or JSON
+ID_FIELD_RE = re.compile(rf'((?:id|arn)"?\s*[=:]\s*){_VALUE}(?:\s*->\s*{_VALUE})?')
+# Ids assigned by AWS, like i-0123456789abcdef0 or sg-0a1b2c3d, matched from the dash
+PROVIDER_ID_RE = re.compile(r'-(?:[0-9a-f]{17}|[0-9a-f]{8})\b')
+PROVIDER_ID_PREFIXES = frozenset(['ami', 'eipalloc', 'eni', 'i', 'igw', 'lt', 'nat', 'rtb', 'sg', 'snap', 'subnet',
+                                  'vol', 'vpc'])
+# ISO 8601 date-times, e.g. from timestamp() in tags; only looked for past TIMESTAMP_HINT_RE
+TIMESTAMP_RE = re.compile(r'\b\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:?\d\d)\b')
+TIMESTAMP_HINT_RE = re.compile(r':\d\d:\d\d')
+
+
+def _word_before(text: str, at: int) -> str:
+    start = at
+    while start and (text[start - 1].isalnum() or text[start - 1] in '_.-'):
+        start -= 1
+    return text[start:at]
+
+
+def _id_field(match: re.Match) -> str:
+    # id or arn must be the whole attribute name, not the end of one like vpc_id
+    if _word_before(match.string, match.start()):
+        return match.group(0)
+    return match.group(1) + '<id>'
+
+
+def _provider_id(match: re.Match) -> str:
+    return '-<id>' if _word_before(match.string, match.start()) in PROVIDER_ID_PREFIXES else match.group(0)
+
+
+def normalize_value(value: str) -> str:
+    """Strip what varies between runs of the same plan from text: colors, ids, timestamps and spacing."""
+    # ESC as escaped in JSON text, too
+    value = ANSI_RE.sub('', value.replace('\\u001b', '\x1b'))
+    value = ID_FIELD_RE.sub(_id_field, value)
+    value = PROVIDER_ID_RE.sub(_provider_id, value)
+    if TIMESTAMP_HINT_RE.search(value):
+        value = TIMESTAMP_RE.sub('<timestamp>', value)
+    # Runs of whitespace, also as escaped in JSON strings, become one space
+    return ' '.join(value.replace('\\n', ' ').replace('\\r', ' ').replace('\\t', ' ').split())
+
+
+def _expanded(value):
+    if isinstance(value, BlobValue):
+        # The digest hashes the raw text, spacing and ids included; use the text, which is normalized
+        return text_slice(value.buffer, value.start, value.end)
+    if isinstance(value, dict):
+        return {key: _expanded(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_expanded(item) for item in value]
+    return value
+
+
+def _attributes(after) -> dict | None:
+    """A change's attributes, decoded without memoizing them in the row's LazyAttributes."""
+    if isinstance(after, LazyAttributes) and after.buffer is not None:
+        return decode_attributes(after.buffer, after.start, after.end)
+    return None if after is None else dict(after)
+
+
+def _change_text(resource_change) -> str:
+    change = resource_change.change
+    deltas = [[delta.path, delta.op, _expanded(delta.before), _expanded(delta.after)]
+              for delta in change.deltas] if change.deltas else None
+    values = json.dumps([_expanded(change.before), _expanded(_attributes(change.after)), deltas],
+                        sort_keys=True, ensure_ascii=False, default=str)
+    # The address goes first so lines sort by it
+    return f'{resource_change.address} {summarize_actions(change.actions)} {values}'
+
+
+def canonical_change(resource_change) -> str:
+    """
+    The parts of a change an explanation depends on, normalized: address, action,
+    and its values and deltas as JSON, the same whether they were decoded yet or not.
+    """
+    return normalize_value(_change_text(resource_change))
+
+
+def plan_fingerprint(resource_changes: Iterable) -> str:
+    """
+    A SHA-256 of a parsed plan that is the same for plans differing only cosmetically:
+    in the order of their resources, colors, spacing, or volatile ids and timestamps.
+    Unlike a hash of the plan bytes, it can key caches of explanations.
+
+    Rows are hashed by their decoded values, so a plan gets the same fingerprint as a
+    PlanTable, a streamed or eagerly parsed list, or rows whose attributes were read.
+    """
+    # All rows are normalized at once, as the patterns cost little per character but
+    # much per call; NUL separates them, as it never occurs in plan text
+    lines = normalize_value('\0'.join(map(_change_text, resource_changes))).split('\0')
+    digest = hashlib.sha256()
+    for line in sorted(line.strip() for line in lines):
+        digest.update(line.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
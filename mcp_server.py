@@ -4,9 +4,11 @@ Working MCP Server - simplified structure based on MCP 1.9.4 patterns.
 """
 
 import asyncio
+import base64
 import json
 import tempfile
 import os
+import sys
 from typing import Any
 from mcp.server.models import InitializationOptions
 import mcp.server.stdio
@@ -15,11 +17,45 @@ from mcp.server import NotificationOptions, Server
 
 
 # Import our agent functions
-from tools import parse_terraform_plan_text
-from agent import run_agent_best_of_n, build_context, BOT_PROMPT
+from plan_cache import parse_plan_table_cached
+from agent import (
+    run_agent_best_of_n_async, Conversation, count_only_summary, format_project_results, render_tool_output, run_agent_projects,
+)
+from atlantis import is_atlantis_comment, split_projects
+from fingerprint import plan_fingerprint
+from sessions import SessionStore
+from tools import count_changes, count_changes_stream, open_plan_payload
 from openai import OpenAI
 
 
+def session_response(reply: str, session_id: str, fingerprint: str = None) -> list[types.TextContent]:
+    """
+    A reply of a session, followed by the session_id to continue it with and the
+    plan's fingerprint, which keys cached explanations.
+    """
+    response = [
+        types.TextContent(type="text", text=reply),
+        types.TextContent(type="text", text=f"session_id: {session_id}")
+    ]
+    if fingerprint is not None:
+        response.append(types.TextContent(type="text", text=f"plan_fingerprint: {fingerprint}"))
+    return response
+
+
+def plan_argument(arguments: dict[str, Any]) -> str | bytes:
+    """The plan of a tool call: plan_text, or the decoded bytes of plan_base64 (plain or gzip/xz/zstd)."""
+    if arguments.get("plan_base64"):
+        return base64.b64decode(arguments["plan_base64"])
+    return arguments.get("plan_text", "")
+
+
+# What each user_preference answers "Count only or full summary?" with
+PREFERENCE_REPLIES = {"count_only": "Count only", "full_summary": "Full summary"}
+
+# Conversations of terraform_explain, by session_id
+sessions = SessionStore()
+
+
 async def main():
     """Main entry point for the MCP server."""
     
@@ -32,21 +68,35 @@ async def main():
         return [
             types.Tool(
                 name="terraform_explain",
-                description="Parse and explain Terraform plan output in plain English",
+                description="Parse and explain Terraform plan output in plain English; Atlantis comments covering several projects are explained per project",
                 inputSchema={
                     "type": "object",
                     "properties": {
                         "plan_text": {
                             "type": "string",
-                            "description": "The raw Terraform plan output text"
+                            "description": "The raw Terraform plan output text, or `terraform show -json` output"
+                        },
+                        "plan_base64": {
+                            "type": "string",
+                            "description": "The plan as base64, optionally compressed with gzip, xz or zstd; used instead of plan_text"
                         },
                         "user_preference": {
                             "type": "string",
                             "enum": ["auto", "count_only", "full_summary"],
                             "default": "auto"
+                        },
+                        "session_id": {
+                            "type": "string",
+                            "description": "Continue the conversation a previous call returned this id for, instead of sending a plan"
+                        },
+                        "message": {
+                            "type": "string",
+                            "description": "The next user message of a session, e.g. 'Full summary' or a follow-up question"
                         }
                     },
-                    "required": ["plan_text"]
+                    "anyOf": [
+                        {"required": ["plan_text"]}, {"required": ["plan_base64"]}, {"required": ["session_id"]}
+                    ]
                 }
             ),
             types.Tool(
@@ -57,7 +107,17 @@ async def main():
                     "properties": {
                         "plan_text": {
                             "type": "string",
-                            "description": "The raw Terraform plan output text"
+                            "description": "The raw Terraform plan output text, or `terraform show -json` output"
+                        },
+                        "plan_base64": {
+                            "type": "string",
+                            "description": "The plan as base64, optionally compressed with gzip, xz or zstd; used instead of plan_text"
+                        },
+                        "user_preference": {
+                            "type": "string",
+                            "enum": ["auto", "count_only", "full_summary"],
+                            "default": "full_summary",
+                            "description": "Answer to the model's 'Count only or full summary?'; count_only skips the model"
                         },
                         "n": {
                             "type": "integer",
@@ -70,9 +130,30 @@ async def main():
                             "default": 0.7,
                             "minimum": 0,
                             "maximum": 2
+                        },
+                        "strategy": {
+                            "type": "string",
+                            "enum": ["concurrent", "choices", "early_exit"],
+                            "default": "concurrent",
+                            "description": "N concurrent requests, one request returning N choices, or stopping at target_score"
+                        },
+                        "target_score": {
+                            "type": "number",
+                            "minimum": 0,
+                            "maximum": 100,
+                            "description": "Stop sampling once a response scores this (early_exit defaults to 100)"
+                        },
+                        "min_samples": {
+                            "type": "integer",
+                            "default": 1,
+                            "minimum": 1
+                        },
+                        "deadline": {
+                            "type": "number",
+                            "description": "Seconds after which the best response so far is returned"
                         }
                     },
-                    "required": ["plan_text"]
+                    "anyOf": [{"required": ["plan_text"]}, {"required": ["plan_base64"]}]
                 }
             )
         ]
@@ -84,48 +165,84 @@ async def main():
             arguments = {}
         
         if name == "terraform_explain":
-            plan_text = arguments.get("plan_text", "")
             user_preference = arguments.get("user_preference", "count_only")
             
+            # Follow-ups only send the new message; the plan and context stay with the session
+            if arguments.get("session_id"):
+                conversation = sessions.get(arguments["session_id"])
+                if conversation is None:
+                    return [types.TextContent(type="text", text="Unknown or expired session_id; send the plan again")]
+                message = arguments.get("message") or PREFERENCE_REPLIES.get(user_preference, "Full summary")
+                if message == "Count only":
+                    reply = count_only_summary(conversation.total)
+                else:
+                    reply = await asyncio.to_thread(conversation.send, message)
+                return session_response(reply, arguments["session_id"], conversation.fingerprint)
+            
+            plan = plan_argument(arguments)
+            
+            # Atlantis comments are split as a whole; other payloads stay compressed until parsed
+            if isinstance(plan, bytes) and is_atlantis_comment(open_plan_payload(plan).read(1024)):
+                plan = open_plan_payload(plan).read()
+            plan_text = plan if isinstance(plan, str) else ""
+            
+            # Atlantis output covering several projects is explained per project, concurrently
+            if len(split_projects(plan_text)) > 1:
+                user_reply = PREFERENCE_REPLIES.get(user_preference)
+                results = await asyncio.to_thread(run_agent_projects, plan_text, user_reply)
+                return [types.TextContent(type="text", text=format_project_results(results))]
+            
+            # Counts are answered from the plan's summary line without calling the model
+            if user_preference == "count_only":
+                count = count_changes(plan) if isinstance(plan, str) else count_changes_stream(open_plan_payload(plan))
+                if count.mismatch:
+                    print(f"Warning: plan summary line disagrees with {count.headers} resource headers",
+                          file=sys.stderr)
+                if not count.total:
+                    return [types.TextContent(type="text", text="No changes found")]
+                return [types.TextContent(type="text", text=count_only_summary(count.total))]
+            
             # Parse plan
-            resource_changes = parse_terraform_plan_text(plan_text)
-            if not resource_changes:
+            plan_table = parse_plan_table_cached(plan)
+            if not plan_table:
                 return [types.TextContent(type="text", text="No changes found")]
             
-            # Build context
-            tool_output = [f"- {change.change.actions[0] if change.change.actions else 'no-op'} {change.address}" 
-                          for change in resource_changes]
+            # Build context from the table columns; attributes are never decoded here,
+            # only the deltas of updated resources considered for the token budget are parsed
+            tool_output = render_tool_output(plan_table, attributes=False)
             
-            # Get explanation
-            history = [{"role": "user", "content": "Count only"}] if user_preference == "count_only" else []
-            context_json = build_context(BOT_PROMPT, tool_output, history)
-            
-            client = OpenAI()
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "system", "content": context_json}],
-                temperature=0
-            )
+            # Get explanation, cached under the plan's fingerprint; the conversation is kept
+            # for follow-ups by session_id
+            fingerprint = await asyncio.to_thread(plan_fingerprint, plan_table)
+            conversation = Conversation(tool_output, total=len(plan_table), plan=plan_table, client=OpenAI(),
+                                        fingerprint=fingerprint)
+            reply = await asyncio.to_thread(conversation.send)
+            if "Count only or full summary?" in reply and user_preference == "full_summary":
+                reply = await asyncio.to_thread(conversation.send, "Full summary")
             
-            return [types.TextContent(type="text", text=response.choices[0].message.content)]
+            return session_response(reply, sessions.create(conversation), fingerprint)
         
         elif name == "terraform_explain_best_of_n":
-            plan_text = arguments.get("plan_text", "")
+            plan = plan_argument(arguments)
             n = arguments.get("n", 3)
             temperature = arguments.get("temperature", 0.7)
             
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-                f.write(plan_text)
+            # Create temporary file; compressed payloads are written as they came
+            with tempfile.NamedTemporaryFile(mode='wb', suffix='.txt', delete=False) as f:
+                f.write(plan.encode("utf-8") if isinstance(plan, str) else plan)
                 temp_path = f.name
             
             try:
                 # Run Best-of-N
-                best_response, best_score, all_responses = run_agent_best_of_n(
+                best_response, best_score, all_responses = await run_agent_best_of_n_async(
                     plan_path=temp_path,
                     n=n,
-                    user_reply="Count only",
-                    temperature=temperature
+                    user_reply=PREFERENCE_REPLIES.get(arguments.get("user_preference", "full_summary")),
+                    temperature=temperature,
+                    strategy=arguments.get("strategy", "concurrent"),
+                    target_score=arguments.get("target_score"),
+                    min_samples=arguments.get("min_samples", 1),
+                    deadline=arguments.get("deadline")
                 )
                 
                 # Format result
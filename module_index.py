@@ -0,0 +1,107 @@
+from collections import Counter
+from typing import Dict, Iterator, List
+
+from tools import MODULE_CALL_RE
+
+
+def module_chain(module: str) -> List[str]:
+    """
+    Return the module paths from the root down to module, e.g. for 'module.a["x"].module.b':
+    ['', 'module.a', 'module.a["x"]', 'module.a["x"].module.b']. A module call with a
+    count/for_each key gets a node for the call and one for the instance.
+    """
+    chain = ['']
+    pos = 0
+    # The path has no trailing dot, so match it as if it had one
+    path = module + '.'
+    while pos < len(module):
+        call = MODULE_CALL_RE.match(path, pos)
+        if call is None:
+            raise ValueError(f'not a module path: {module!r}')
+        if call.group(2):
+            chain.append(path[:call.start(2)])
+        chain.append(path[:call.end() - 1])
+        pos = call.end()
+    return chain
+
+
+class ModuleNode:
+    """A module (or module instance) in a plan's module tree, with counts over its whole subtree."""
+
+    __slots__ = ('path', 'children', 'total', 'direct', 'actions', 'types')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.children: Dict[str, 'ModuleNode'] = {}
+        self.total = 0
+        # Resources declared in this module itself rather than in a submodule
+        self.direct = 0
+        self.actions: Counter = Counter()
+        self.types: Counter = Counter()
+
+    def counts(self, by: str) -> Dict[str, int]:
+        """Count the subtree's resources by 'action' or 'type'."""
+        return dict(self.actions if by == 'action' else self.types)
+
+    def __repr__(self) -> str:
+        return f'ModuleNode({self.path!r}, total={self.total})'
+
+
+class ModuleIndex:
+    """
+    Tree of the modules in a plan, with per-node counts by action and resource type.
+
+    Counts are added up along the way as resources are added, so each add and each
+    lookup costs O(depth) and no aggregate needs another pass over the resources.
+    """
+
+    def __init__(self):
+        self.root = ModuleNode('')
+        # Node chains of module paths seen before, so repeated modules are not re-parsed
+        self._chains: Dict[str, List[ModuleNode]] = {'': [self.root]}
+
+    def _chain(self, module: str) -> List[ModuleNode]:
+        chain = self._chains.get(module)
+        if chain is None:
+            chain = [self.root]
+            for path in module_chain(module)[1:]:
+                node = chain[-1].children.get(path)
+                if node is None:
+                    node = chain[-1].children[path] = ModuleNode(path)
+                chain.append(node)
+            self._chains[module] = chain
+        return chain
+
+    def add(self, module: str, action: str, resource_type: str, count: int = 1) -> None:
+        """Count count resources of the given module path (as returned by split_module_path)."""
+        chain = self._chain(module)
+        for node in chain:
+            node.total += count
+            node.actions[action] += count
+            node.types[resource_type] += count
+        chain[-1].direct += count
+
+    def node(self, module: str = '') -> ModuleNode | None:
+        """Return the node of a module path, or None if the plan has no resources under it."""
+        chain = self._chains.get(module)
+        if chain is not None:
+            return chain[-1]
+        node = self.root
+        for path in module_chain(module)[1:]:
+            node = node.children.get(path)
+            if node is None:
+                return None
+        return node
+
+    def counts(self, module: str = '', by: str = 'action') -> Dict[str, int]:
+        """Count the resources under a module path by 'action' or 'type'."""
+        node = self.node(module)
+        return node.counts(by) if node else {}
+
+    def walk(self, node: ModuleNode | None = None) -> Iterator[ModuleNode]:
+        """Yield the nodes of the tree depth-first, parents before their children."""
+        stack = [node or self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(list(node.children.values())))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Differential fuzz and throughput harness for the plan parsers.
+
+Generates random but realistic text plans, runs a reference parser and candidate
+parsers on each, and reports any difference in the ResourceChanges they return,
+followed by each parser's throughput on one large plan. Runs offline.
+
+    python parser_bench.py                                  # all built-in candidates
+    python parser_bench.py --reference text                 # compare against the current parser
+    python parser_bench.py --candidate bytes --seeds 500
+    python parser_bench.py --candidate mypkg.parser:parse   # any function taking plan text
+"""
+
+import argparse
+import importlib
+import io
+import json
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+
+import legacy_parser
+from plan_table import PlanTable
+from tools import (
+    DELTA_ACTIONS, BlobScanner, blob_value, iter_resource_changes, iter_resource_changes_buffer, opens_blob,
+    parse_deltas, parse_terraform_plan_text, parse_terraform_plan_text_parallel, split_address,
+)
+
+Parser = Callable[[str], List]
+
+# The block split and attribute match of the legacy parser
+LEGACY_BLOCK_RE = re.compile(r'\n  # (.+?) will be (.+?)\n')
+LEGACY_ATTRIBUTE_RE = re.compile(r'[+~-]?\s*(\w+)\s*=\s*(.+)')
+
+# Built-in parsers, by name; each takes plan text and returns a list of ResourceChanges
+PARSERS: Dict[str, Parser] = {
+    'legacy': legacy_parser.parse_terraform_plan_text,
+    'text': parse_terraform_plan_text,
+    'stream': lambda plan_text: list(iter_resource_changes(io.StringIO(plan_text))),
+    'bytes': lambda plan_text: list(iter_resource_changes_buffer(plan_text.encode('utf-8'))),
+    'table': lambda plan_text: list(PlanTable.from_text(plan_text)),
+    'parallel': lambda plan_text: parse_terraform_plan_text_parallel(plan_text, workers=2, chunk_size=64 * 1024),
+}
+
+ACTIONS = [
+    ('created', '+'),
+    ('updated in-place', '~'),
+    ('destroyed', '-'),
+    ('replaced', '-/+'),
+]
+RESOURCE_TYPES = [
+    'aws_instance', 'aws_s3_bucket', 'aws_security_group', 'aws_iam_policy', 'google_storage_bucket_iam_binding',
+    'google_redis_instance', 'aws_route53_record',
+]
+WORDS = ['web', 'api', 'db', 'cache', 'logs', 'main', 'edge', 'worker', 'prod', 'stg']
+
+
+def _name(rng: random.Random) -> str:
+    return rng.choice(WORDS) + rng.choice(['', '_' + rng.choice(WORDS)])
+
+
+def _instance_key(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.2:
+        return f'[{rng.randrange(4)}]'
+    if roll < 0.35:
+        # for_each keys, sometimes with dots in them
+        return f'["{rng.choice(WORDS)}{rng.choice(["", ".example.com"])}"]'
+    return ''
+
+
+def random_address(rng: random.Random) -> str:
+    """A resource address in up to three levels of (possibly indexed or keyed) modules."""
+    modules = ''.join(f'module.{_name(rng)}{_instance_key(rng)}.' for _ in range(rng.choice([0, 0, 1, 1, 2, 3])))
+    return f'{modules}{rng.choice(RESOURCE_TYPES)}.{_name(rng)}{_instance_key(rng)}'
+
+
+def _value(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.15:
+        return '(known after apply)'
+    if roll < 0.3:
+        return str(rng.randrange(65536))
+    if roll < 0.4:
+        return rng.choice(['true', 'false'])
+    return f'"{_name(rng)}-{rng.randrange(1000)}"'
+
+
+def _body(rng: random.Random, marker: str, indent: str) -> List[str]:
+    """Attribute lines of a block, in Terraform's layout for the given change marker."""
+    lines = []
+    keys = ['name', 'region', 'instance_type', 'tier', 'ami', 'port', 'id', 'description', 'members', 'tags']
+    for key in rng.sample(keys, rng.randrange(8)):
+        roll = rng.random()
+        if marker != '~':
+            lines.append(f'{indent}{marker} {key} = {_value(rng)}')
+        elif key not in ('members', 'tags') and roll < 0.6:
+            suffix = ' # forces replacement' if rng.random() < 0.2 else ''
+            lines.append(f'{indent}~ {key} = {_value(rng)} -> {_value(rng)}{suffix}')
+        elif key not in ('members', 'tags'):
+            lines.append(f'{indent}  {key} = {_value(rng)}')
+        elif key == 'members':
+            lines += [
+                f'{indent}~ members = [',
+                f'{indent}    + "serviceAccount:{_name(rng)}@example.iam.gserviceaccount.com",',
+                f'{indent}    - "user:{_name(rng)}@example.com",',
+                f'{indent}      # ({rng.randrange(1, 9)} unchanged elements hidden)',
+                f'{indent}  ]',
+            ]
+        else:
+            lines += [
+                f'{indent}~ tags = {{',
+                f'{indent}    ~ "Name" = "{_name(rng)}" -> "{_name(rng)}"',
+                f'{indent}    + "Env"  = "{rng.choice(WORDS)}"',
+                f'{indent}  }}',
+            ]
+
+    # Nested blocks, heredocs and JSON policies
+    if rng.random() < 0.3:
+        block_marker = marker if marker != '-/+' else rng.choice(['+', '-'])
+        lines += [f'{indent}{block_marker} ingress {{'] + [
+            f'{indent}    {block_marker if block_marker != "~" else "+"} from_port = {rng.randrange(1024)}'
+        ] + [f'{indent}  }}']
+    if rng.random() < 0.1:
+        lines += [f'{indent}{marker} user_data = <<-EOT', f'{indent}      #!/bin/bash']
+        lines += [f'{indent}      export {_name(rng).upper()} = "{_name(rng)}"' for _ in range(rng.randrange(80))]
+        lines += [f'{indent}  EOT']
+    if rng.random() < 0.1:
+        lines += [f'{indent}{marker} policy = jsonencode(', f'{indent}      {{', f'{indent}        + Statement = [']
+        for _ in range(rng.randrange(1, 30)):
+            lines += [
+                f'{indent}            + {{',
+                f'{indent}                + Action   = "s3:{rng.choice(["Get", "Put", "List"])}Object"',
+                f'{indent}                + Resource = "arn:aws:s3:::{_name(rng)}/*"',
+                f'{indent}              }},',
+            ]
+        lines += [f'{indent}          ]', f'{indent}      }}', f'{indent}  )']
+    if marker == '~' and rng.random() < 0.7:
+        lines.append(f'{indent}  # ({rng.randrange(1, 20)} unchanged attributes hidden)')
+    if rng.random() < 0.2:
+        lines.append(f'{indent}  # ({rng.randrange(1, 4)} unchanged blocks hidden)')
+    return lines
+
+
+def generate_plan(rng: random.Random, resources: int) -> str:
+    """Return text plan output with the given number of resource blocks."""
+    lines = [
+        'Terraform used the selected providers to generate the following execution',
+        'plan. Resource actions are indicated with the following symbols:',
+        '  + create',
+        '  ~ update in-place',
+        '  - destroy',
+        '-/+ destroy and then create replacement',
+        '',
+        'Terraform will perform the following actions:',
+        '',
+    ]
+    counts = {'created': 0, 'updated in-place': 0, 'destroyed': 0, 'replaced': 0}
+    for _ in range(resources):
+        address = random_address(rng)
+        action, marker = rng.choice(ACTIONS)
+        counts[action] += 1
+        resource_type, name = split_address(address)
+        lines.append(f'  # {address} will be {action}')
+        if action == 'replaced' and rng.random() < 0.5:
+            lines.append('  # (because a tainted object must be replaced)')
+        lines.append(f'{marker:>3} resource "{resource_type}" "{name.split("[")[0]}" {{')
+        lines += _body(rng, '~' if marker == '-/+' else marker, '      ')
+        lines += ['    }', '']
+
+    to_add = counts['created'] + counts['replaced']
+    to_destroy = counts['destroyed'] + counts['replaced']
+    lines.append(f"Plan: {to_add} to add, {counts['updated in-place']} to change, {to_destroy} to destroy.")
+    return '\n'.join(lines) + '\n'
+
+
+def load_parser(spec: str) -> Parser:
+    """Resolve a built-in parser name or a 'module:function' spec."""
+    if spec in PARSERS:
+        return PARSERS[spec]
+    module_name, _, function_name = spec.partition(':')
+    if not function_name:
+        raise ValueError(f"unknown parser {spec!r}; use one of {', '.join(PARSERS)} or module:function")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def dump(resource_changes) -> List[dict]:
+    """Plain-data form of parser output, with lazy attributes decoded, for comparison."""
+    return [resource_change.model_dump() for resource_change in resource_changes]
+
+
+def _legacy_blocks(plan_text: str) -> List[str]:
+    """The body of each block the legacy parser found, in its order."""
+    parts = LEGACY_BLOCK_RE.split(plan_text)
+    return [parts[i + 2] for i in range(1, len(parts), 3) if i + 2 < len(parts)]
+
+
+def _multi_line_values(body: str) -> tuple[Dict[str, str], set]:
+    """
+    Read the heredoc and jsonencode(...) values of a block from its text: their
+    values as the rewrite decodes them, and the keys of the `key = value` lines
+    the legacy parser read from inside them (and from nowhere else).
+    """
+    values, inside, outside = {}, set(), set()
+    lines = body.split('\n')
+    index = 0
+    while index < len(lines):
+        match = LEGACY_ATTRIBUTE_RE.match(lines[index].strip())
+        index += 1
+        if not match:
+            continue
+        if not opens_blob(match.group(2).strip()):
+            outside.add(match.group(1))
+            continue
+        scanner = BlobScanner(match.group(2).strip())
+        start = index
+        while index < len(lines) and not scanner.closes(lines[index]):
+            index += 1
+        # The value's lines end with their newline, unless it runs to the end of the block
+        text = '\n'.join(lines[start:index]) + ('\n' if index < len(lines) else '')
+        keys = scanner.keys if scanner.kind == 'jsonencode' else None
+        values[match.group(1)] = str(blob_value(scanner.kind, text, 0, len(text), keys, scanner.statements))
+        # The closing line too was read as a line of the block
+        for line in lines[start:index + 1]:
+            leaked = LEGACY_ATTRIBUTE_RE.match(line.strip())
+            if leaked:
+                inside.add(leaked.group(1))
+        index += 1
+    return values, inside - outside
+
+
+def legacy_comparable(plan_text: str, expected: List[dict]) -> List[dict]:
+    """
+    Make, from the plan text, the changes the rewrite made on purpose to the legacy
+    parser's dumped output, so that a candidate's output can be compared with it:
+
+    - resources in nested modules get the type and name of the resource itself,
+      where the legacy parser took them from the second and later address parts;
+    - heredoc and jsonencode(...) values are decoded (large ones into a BlobValue
+      digest), where the legacy parser kept their first line, and the `key = value`
+      lines inside them are no longer read as attributes of their own;
+    - updates and replaces have deltas, which the legacy parser did not produce.
+
+    Nothing is taken from the candidate's output, so whatever it gets wrong shows.
+    """
+    bodies = _legacy_blocks(plan_text)
+    if len(bodies) != len(expected):
+        # The legacy fallback found headers only
+        bodies = [''] * len(expected)
+    comparable = []
+    for want, body in zip(expected, bodies):
+        want = {**want, 'change': dict(want['change'])}
+        if want['address'].startswith('module.'):
+            want['type'], want['name'] = split_address(want['address'])
+        values, leaked = _multi_line_values(body)
+        if want['change']['after'] is not None and (values or leaked):
+            after = {key: value for key, value in want['change']['after'].items() if key not in leaked}
+            after.update((key, value) for key, value in values.items() if key in after)
+            want['change']['after'] = after or None
+        deltas = None
+        if want['change']['actions'][0] in DELTA_ACTIONS:
+            deltas = [delta.model_dump() for delta in parse_deltas(body.split('\n'))] or None
+        want['change']['deltas'] = deltas
+        comparable.append(want)
+    return comparable
+
+
+# Reference parsers whose output needs normalizing before it is compared, by name
+NORMALIZERS: Dict[str, Callable[[str, List[dict]], List[dict]]] = {
+    'legacy': legacy_comparable,
+}
+
+
+def first_difference(expected: List[dict], actual: List[dict]) -> str | None:
+    """Describe the first difference between two dumped outputs, or None if they are equal."""
+    if expected == actual:
+        return None
+    for index, (want, got) in enumerate(zip(expected, actual)):
+        if want != got:
+            return (f'resource {index} ({want["address"]}):\n'
+                    f'  reference: {json.dumps(want, default=str)}\n'
+                    f'  candidate: {json.dumps(got, default=str)}')
+    return f'{len(expected)} resources from the reference, {len(actual)} from the candidate'
+
+
+def fuzz(reference: Parser, candidate: Parser, seeds: int, resources: int, start_seed: int = 0,
+         normalize: Callable[[str, List[dict]], List[dict]] | None = None) -> List[tuple[int, str]]:
+    """
+    Compare the parsers on one generated plan per seed; return (seed, difference) pairs.
+    normalize(plan_text, expected) adjusts the reference's dumped output first.
+    """
+    failures = []
+    for seed in range(start_seed, start_seed + seeds):
+        rng = random.Random(seed)
+        plan_text = generate_plan(rng, rng.randrange(resources + 1))
+        expected, actual = dump(reference(plan_text)), dump(candidate(plan_text))
+        if normalize is not None:
+            expected = normalize(plan_text, expected)
+        difference = first_difference(expected, actual)
+        if difference is not None:
+            failures.append((seed, difference))
+    return failures
+
+
+def throughput(parser: Parser, plan_text: str, repeat: int = 3, decode: bool = False) -> tuple[float, float]:
+    """Return (MB/s, resources/s) for the best of repeat runs; decode also reads every attribute."""
+    size = len(plan_text.encode('utf-8'))
+    best = float('inf')
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        resource_changes = parser(plan_text)
+        if decode:
+            for resource_change in resource_changes:
+                if resource_change.change.after is not None:
+                    dict(resource_change.change.after)
+        best = min(best, time.perf_counter() - start)
+        count = len(resource_changes)
+    return size / best / 1e6, count / best
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reference', default='legacy',
+                        help='reference parser (default: legacy, the parser before the rewrite)')
+    parser.add_argument('--candidate', action='append',
+                        help='candidate parser, by name or module:function; repeatable (default: all built-ins)')
+    parser.add_argument('--seeds', type=int, default=200, help='generated plans to compare on')
+    parser.add_argument('--resources', type=int, default=30, help='maximum resources per fuzz plan')
+    parser.add_argument('--bench-resources', type=int, default=20000, help='resources in the throughput plan')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per parser; the best is reported')
+    parser.add_argument('--decode', action='store_true', help='include decoding every attribute in the timings')
+    args = parser.parse_args(argv)
+
+    reference = load_parser(args.reference)
+    names = args.candidate or [name for name in PARSERS if name != args.reference]
+    candidates = {name: load_parser(name) for name in names}
+
+    print(f'Differential fuzz: {args.seeds} plans of up to {args.resources} resources')
+    failed = False
+    for name, candidate in candidates.items():
+        failures = fuzz(reference, candidate, args.seeds, args.resources, normalize=NORMALIZERS.get(args.reference))
+        print(f'  {name:<12} {"ok" if not failures else f"{len(failures)} mismatching plans"}')
+        if failures:
+            failed = True
+            seed, difference = failures[0]
+            print(f'    first mismatch at seed {seed}, {difference}')
+
+    plan_text = generate_plan(random.Random(0), args.bench_resources)
+    size = len(plan_text.encode('utf-8')) / 1e6
+    print(f'\nThroughput on {args.bench_resources} resources ({size:.1f} MB)'
+          f'{", attributes decoded" if args.decode else ""}')
+    for name, candidate in {args.reference: reference, **candidates}.items():
+        mb_per_s, resources_per_s = throughput(candidate, plan_text, args.repeat, args.decode)
+        print(f'  {name:<12} {mb_per_s:8.1f} MB/s  {resources_per_s:10.0f} resources/s')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import hashlib
+import marshal
+import mmap
+import os
+import sys
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from plan_table import PlanTable, load_plan_table
+from tools import (
+    COMPRESSION_MAGIC_SIZE, JSON_CHUNK_SIZE, AttributeDelta, BlobValue, Change, ResourceChange,
+    compression_format, is_compressed_stdin, is_json_plan, iter_resource_changes_stream, open_plan_payload,
+    parse_terraform_plan_json, plan_compression, text_slice,
+)
+
+# Cache files start with this; the rest is a zlib-compressed marshal of table columns or row tuples
+CACHE_MAGIC = b'TAPC4\n'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_root() -> Path:
+    """Directory shared by terra-agent caches, overridable with TERRA_AGENT_CACHE_DIR."""
+    return Path(os.environ.get('TERRA_AGENT_CACHE_DIR') or Path.home() / '.cache' / 'terra-agent')
+
+
+def caching_enabled() -> bool:
+    """Caches are on unless TERRA_AGENT_CACHE is set to 0/false/off."""
+    return os.environ.get('TERRA_AGENT_CACHE', '1').lower() not in ('0', 'false', 'off')
+
+
+def _pack_value(value):
+    # marshal only takes exact built-in types; tuples never occur in parsed values otherwise
+    if isinstance(value, BlobValue):
+        return str(value), value.kind, text_slice(value.buffer, value.start, value.end)
+    return value
+
+
+def _unpack_value(value):
+    if isinstance(value, tuple):
+        digest, kind, text = value
+        return BlobValue(digest, kind, text, 0, len(text))
+    return value
+
+
+def _pack_values(values) -> dict | None:
+    return None if values is None else {key: _pack_value(value) for key, value in values.items()}
+
+
+def _unpack_values(values: dict | None) -> dict | None:
+    return None if values is None else {key: _unpack_value(value) for key, value in values.items()}
+
+
+def _pack_rows(resource_changes) -> tuple:
+    return tuple(
+        (
+            change.address,
+            change.mode,
+            change.type,
+            change.name,
+            tuple(change.change.actions),
+            _pack_values(change.change.before),
+            _pack_values(change.change.after),
+            None if change.change.deltas is None else tuple(
+                (delta.path, delta.op, _pack_value(delta.before), _pack_value(delta.after))
+                for delta in change.change.deltas
+            ),
+        )
+        for change in resource_changes
+    )
+
+
+def _unpack_rows(rows: tuple) -> Iterator[ResourceChange]:
+    # The rows were validated when first parsed, so skip pydantic validation
+    for address, mode, resource_type, name, actions, before, after, deltas in rows:
+        yield ResourceChange.model_construct(
+            address=address,
+            mode=mode,
+            type=resource_type,
+            name=name,
+            change=Change.model_construct(
+                actions=list(actions),
+                before=_unpack_values(before),
+                after=_unpack_values(after),
+                deltas=None if deltas is None else [
+                    AttributeDelta.model_construct(
+                        path=path, op=op, before=_unpack_value(delta_before), after=_unpack_value(delta_after)
+                    )
+                    for path, op, delta_before, delta_after in deltas
+                ]
+            )
+        )
+
+
+class PlanCache:
+    """
+    Content-addressed on-disk cache of parsed plans.
+
+    Entries are keyed by the SHA-256 of the plan bytes. Plans parsed from text keep
+    the table columns (interned strings, codes and buffer offsets), so a hit skips
+    the scan and rows still decode lazily from the plan buffer; JSON plans keep the
+    rows in a compact binary form.
+    Reading an entry bumps its mtime, and writes evict the least recently used
+    entries once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory: str | Path | None = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory) if directory else cache_root() / 'plans'
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(data) -> str:
+        """Return the cache key for plan bytes."""
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        # marshal output is only guaranteed to load on the interpreter that wrote it
+        return self.directory / f'{key}.{sys.implementation.cache_tag}'
+
+    def get(self, key: str, open_buffer: Callable[[], Any] | None = None) -> PlanTable | None:
+        """
+        Return the cached table for key, or None on a miss.
+
+        open_buffer returns the plan bytes the key was computed from (e.g. a memory
+        map of the file); it is only called for entries of text plans, whose rows
+        are read from it. Without it those entries count as misses.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if not data.startswith(CACHE_MAGIC):
+                raise ValueError('not a plan cache entry')
+            kind, state = marshal.loads(zlib.decompress(data[len(CACHE_MAGIC):]))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, TypeError, zlib.error):
+            # Corrupt or foreign entry: drop it and treat as a miss
+            path.unlink(missing_ok=True)
+            return None
+
+        if kind == 'columns':
+            if open_buffer is None:
+                return None
+            table = PlanTable.from_column_state(open_buffer(), state)
+        else:
+            table = PlanTable.from_resource_changes(_unpack_rows(state))
+        # Mark as recently used for eviction
+        os.utime(path)
+        return table
+
+    def put(self, key: str, resource_changes) -> None:
+        """Store a table (or resource changes) under key; rows not over a buffer are decoded."""
+        if isinstance(resource_changes, PlanTable) and resource_changes.resources is None:
+            entry = ('columns', resource_changes.column_state())
+        else:
+            entry = ('rows', _pack_rows(resource_changes))
+        data = CACHE_MAGIC + zlib.compress(marshal.dumps(entry), 1)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def default_plan_cache() -> PlanCache | None:
+    """Return the shared plan cache, or None if caching is turned off."""
+    return PlanCache() if caching_enabled() else None
+
+
+def _map_file(path: str):
+    with open(path, 'rb') as f:
+        # Empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _parse_bytes(data: bytes) -> PlanTable:
+    if is_json_plan(data[:JSON_CHUNK_SIZE].decode('utf-8', 'replace')):
+        return PlanTable.from_resource_changes(parse_terraform_plan_json(data.decode('utf-8')))
+    return PlanTable.from_buffer(data)
+
+
+def load_plan_table_cached(path: str, cache: PlanCache | None = None) -> PlanTable:
+    """
+    Like load_plan_table, but reuse the parsed table of a byte-identical plan seen before.
+
+    Compressed plans are not cached: they are decompressed as a stream while they
+    are parsed, which takes less than loading their rows from an entry would.
+    """
+    cache = cache or default_plan_cache()
+    if path == '-' or path == '/dev/stdin':
+        if cache is None or is_compressed_stdin():
+            return load_plan_table(path)
+        return parse_plan_table_cached(sys.stdin.buffer.read(), cache)
+    if cache is None or plan_compression(path):
+        return load_plan_table(path)
+
+    with open(path, 'rb') as f:
+        key = hashlib.file_digest(f, 'sha256').hexdigest()
+
+    table = cache.get(key, lambda: _map_file(path))
+    if table is None:
+        table = load_plan_table(path)
+        cache.put(key, table)
+    return table
+
+
+def parse_plan_table_cached(plan: str | bytes, cache: PlanCache | None = None) -> PlanTable:
+    """
+    Like PlanTable.from_text, but reuse the parsed table of a byte-identical plan seen before.
+
+    Text plans are parsed from their UTF-8 bytes, so row offsets are byte offsets.
+    Bytes compressed with gzip, xz or zstd are not cached, but decompressed as a
+    stream while they are parsed.
+    """
+    cache = cache or default_plan_cache()
+    data = plan.encode('utf-8') if isinstance(plan, str) else plan
+    if compression_format(data[:COMPRESSION_MAGIC_SIZE]):
+        return PlanTable.from_resource_changes(iter_resource_changes_stream(open_plan_payload(data)))
+    if cache is None:
+        return _parse_bytes(data)
+
+    key = PlanCache.key(data)
+    table = cache.get(key, lambda: data)
+    if table is None:
+        table = _parse_bytes(data)
+        cache.put(key, table)
+    return table
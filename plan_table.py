@@ -0,0 +1,230 @@
+import mmap
+import os
+import sys
+from array import array
+from collections import Counter
+from collections.abc import Sequence
+from typing import Dict, Iterable, List
+
+from tools import (
+    DELTA_ACTIONS, JSON_CHUNK_SIZE, Change, LazyDeltas, ResourceChange, body_lines, is_compressed_stdin, is_json_plan,
+    is_json_plan_file, iter_resource_changes_json, iter_resource_changes_stream, lazy_attributes, open_plan_text,
+    parse_action, parse_terraform_plan_json, plan_compression, scan_blocks, split_address,
+    split_module_path, stream_chunks, summarize_actions, text_slice,
+)
+from module_index import ModuleIndex
+
+# Columns holding interned strings, usable with counts() and group_by()
+COLUMNS = ('action', 'type', 'module')
+
+
+def module_path(address: str) -> str:
+    """Return the module part of a resource address ("" for the root module)."""
+    return split_module_path(address)[0]
+
+
+class PlanTable(Sequence):
+    """
+    Columnar, array-backed representation of a parsed plan.
+
+    Action, type and module strings are interned once and stored per row as indexes;
+    addresses and attribute blocks are kept as offsets into the plan buffer. Indexing
+    the table returns a ResourceChange view built on demand, so it can stand in for
+    the list returned by load_plan.
+
+    Tables built from JSON plans, whose entries arrive already decoded, keep those
+    ResourceChanges in `resources` and serve them as rows.
+
+    `modules` indexes the rows by module as they are appended, with per-module
+    counts by action and type.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.resources: List[ResourceChange] | None = None
+        self.strings: Dict[str, List[str]] = {column: [] for column in COLUMNS}
+        self.codes: Dict[str, array] = {column: array('I') for column in COLUMNS}
+        self._interned: Dict[str, Dict[str, int]] = {column: {} for column in COLUMNS}
+        self.address_start = array('Q')
+        self.address_end = array('Q')
+        self.body_start = array('Q')
+        self.body_end = array('Q')
+        self.modules = ModuleIndex()
+
+    @classmethod
+    def from_buffer(cls, buffer) -> 'PlanTable':
+        """Build a table from plan output held in a buffer (str, bytes, mmap, ...)."""
+        table = cls(buffer)
+        for address_start, address_end, action_start, action_end, body_start, body_end in scan_blocks(buffer):
+            address = text_slice(buffer, address_start, address_end).strip()
+            table.append(
+                address_start, address_end, body_start, body_end,
+                action=parse_action(text_slice(buffer, action_start, action_end).strip())[0],
+                resource_type=split_address(address)[0],
+                module=module_path(address)
+            )
+        return table
+
+    @classmethod
+    def from_resource_changes(cls, resource_changes: Iterable[ResourceChange]) -> 'PlanTable':
+        """Build a table over already decoded ResourceChanges, such as those of a JSON plan."""
+        table = cls(None)
+        table.resources = []
+        for resource_change in resource_changes:
+            table.resources.append(resource_change)
+            table.append(
+                0, 0, 0, 0,
+                action=summarize_actions(resource_change.change.actions),
+                resource_type=resource_change.type,
+                module=module_path(resource_change.address)
+            )
+        return table
+
+    @classmethod
+    def from_text(cls, plan_text: str) -> 'PlanTable':
+        """Build a table from plan output text (offsets are then character offsets) or a JSON plan."""
+        if is_json_plan(plan_text[:JSON_CHUNK_SIZE]):
+            return cls.from_resource_changes(parse_terraform_plan_json(plan_text))
+        return cls.from_buffer(plan_text)
+
+    def column_state(self) -> tuple:
+        """
+        The interned strings, codes and offsets of a table over a buffer, as built-in
+        values (e.g. to marshal); from_column_state rebuilds the table from them.
+        """
+        return (
+            tuple(tuple(self.strings[column]) for column in COLUMNS),
+            tuple(self.codes[column].tobytes() for column in COLUMNS),
+            tuple(offsets.tobytes() for offsets in (self.address_start, self.address_end, self.body_start, self.body_end)),
+        )
+
+    @classmethod
+    def from_column_state(cls, buffer, state: tuple) -> 'PlanTable':
+        """Rebuild a table over the buffer it was built from, without scanning the buffer again."""
+        strings, codes, offsets = state
+        table = cls(buffer)
+        for column, values, data in zip(COLUMNS, strings, codes):
+            table.strings[column] = list(values)
+            table._interned[column] = {value: code for code, value in enumerate(values)}
+            table.codes[column].frombytes(data)
+        for column, data in zip((table.address_start, table.address_end, table.body_start, table.body_end), offsets):
+            column.frombytes(data)
+        # Rows sharing an action, type and module are added to the module index at once
+        actions, types, modules = (table.strings[column] for column in COLUMNS)
+        rows = Counter(zip(*(table.codes[column] for column in COLUMNS)))
+        for (action, resource_type, module), count in rows.items():
+            table.modules.add(modules[module], actions[action], types[resource_type], count)
+        return table
+
+    def append(self, address_start: int, address_end: int, body_start: int, body_end: int,
+               action: str, resource_type: str, module: str) -> None:
+        """Add a row for the block whose address and body sit at the given buffer offsets."""
+        self.address_start.append(address_start)
+        self.address_end.append(address_end)
+        self.body_start.append(body_start)
+        self.body_end.append(body_end)
+        self.codes['action'].append(self._intern('action', action))
+        self.codes['type'].append(self._intern('type', resource_type))
+        self.codes['module'].append(self._intern('module', module))
+        self.modules.add(module, action, resource_type)
+
+    def _intern(self, column: str, value: str) -> int:
+        code = self._interned[column].get(value)
+        if code is None:
+            code = len(self.strings[column])
+            self._interned[column][value] = code
+            self.strings[column].append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.address_start)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('PlanTable index out of range')
+        if self.resources is not None:
+            return self.resources[index]
+
+        address = self.address(index)
+        action = self.value('action', index)
+        after = lazy_attributes(self.buffer, self.body_start[index], self.body_end[index])
+        deltas = None
+        if action in DELTA_ACTIONS:
+            deltas = LazyDeltas(body_lines(self.buffer, self.body_start[index], self.body_end[index]))
+        # Rows come straight from the parser, so skip pydantic validation
+        change = Change.model_construct(actions=[action], after=after, deltas=deltas)
+        return ResourceChange.model_construct(
+            address=address,
+            mode='managed',
+            type=self.value('type', index),
+            name=split_address(address)[1],
+            change=change
+        )
+
+    def address(self, index: int) -> str:
+        """Decode the address of a row without materializing the rest of it."""
+        if self.resources is not None:
+            return self.resources[index].address
+        return text_slice(self.buffer, self.address_start[index], self.address_end[index]).strip()
+
+    def value(self, column: str, index: int) -> str:
+        """Return the interned string of a row in one of the COLUMNS."""
+        return self.strings[column][self.codes[column][index]]
+
+    def counts(self, by: str) -> Dict[str, int]:
+        """Count rows per distinct value of a column, e.g. counts('action')."""
+        if by in ('action', 'type'):
+            # Kept up to date by the module index as rows are appended
+            return self.modules.root.counts(by)
+        strings = self.strings[by]
+        return {strings[code]: count for code, count in Counter(self.codes[by]).items()}
+
+    def group_by(self, by: str) -> Dict[str, array]:
+        """Group row indexes by the value of a column."""
+        strings = self.strings[by]
+        groups: Dict[str, array] = {}
+        for index, code in enumerate(self.codes[by]):
+            rows = groups.get(strings[code])
+            if rows is None:
+                rows = groups[strings[code]] = array('I')
+            rows.append(index)
+        return groups
+
+    def close(self) -> None:
+        """Release the underlying buffer if it is memory-mapped; undecoded row attributes become unreadable."""
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+def load_plan_table(path: str) -> PlanTable:
+    """
+    Load a Terraform plan (text or `terraform show -json`) from a file or stdin into a PlanTable.
+
+    Plans compressed with gzip, xz or zstd are decompressed and parsed as a stream.
+    """
+    if path == '-' or path == '/dev/stdin':
+        if is_compressed_stdin():
+            return PlanTable.from_resource_changes(iter_resource_changes_stream(open_plan_text(path)))
+        data = sys.stdin.buffer.read()
+        if data.lstrip().startswith(b'{'):
+            return PlanTable.from_resource_changes(parse_terraform_plan_json(data.decode('utf-8')))
+        return PlanTable.from_buffer(data)
+
+    if plan_compression(path):
+        with open_plan_text(path) as f:
+            return PlanTable.from_resource_changes(iter_resource_changes_stream(f))
+
+    if is_json_plan_file(path):
+        with open(path, 'r') as f:
+            return PlanTable.from_resource_changes(iter_resource_changes_json(stream_chunks(f)))
+
+    with open(path, 'rb') as f:
+        # Empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return PlanTable.from_buffer(b'')
+        # The mapping outlives the file object; rows are decoded from it on access
+        return PlanTable.from_buffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
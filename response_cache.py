@@ -0,0 +1,154 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+from plan_cache import cache_root, caching_enabled
+
+# Seconds a response is served from the cache after it was stored
+DEFAULT_TTL = 7 * 24 * 3600
+# Responses kept on disk; the least recently used are evicted past this
+DEFAULT_MAX_ENTRIES = 10000
+# Responses also kept in memory, in front of the database
+MEMORY_ENTRIES = 256
+
+
+class ResponseCache:
+    """
+    Cache of model responses, keyed on the model, the temperature and a hash of the
+    exact messages sent.
+
+    An in-memory LRU sits in front of a SQLite table under the cache root, so
+    responses outlive the process: a re-run of an unchanged plan is answered without
+    a request. Entries expire ttl seconds after they were stored, and past
+    max_entries the least recently used are evicted. hits and misses count lookups.
+    Database errors degrade to memory-only caching rather than failing the request.
+    """
+
+    def __init__(self, path: str | Path | None = None, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, memory_entries: int = MEMORY_ENTRIES):
+        self.path = Path(path) if path else cache_root() / 'responses.sqlite3'
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[float, List[str]]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, temperature: float, messages: List[dict], n: int = 1) -> str:
+        """Return the cache key of a completion request."""
+        request = json.dumps([model, temperature, n, messages], sort_keys=True, ensure_ascii=False,
+                             separators=(',', ':'))
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self._db is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS responses '
+                    '(key TEXT PRIMARY KEY, created REAL NOT NULL, used REAL NOT NULL, choices TEXT NOT NULL)'
+                )
+                self._db.execute('CREATE INDEX IF NOT EXISTS responses_used ON responses (used)')
+            except (OSError, sqlite3.Error):
+                self._db = None
+        return self._db
+
+    def _remember(self, key: str, created: float, choices: List[str]) -> None:
+        self._memory[key] = (created, choices)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> List[str] | None:
+        """Return the cached choices for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self._touch(key, now)
+                self.hits += 1
+                return list(entry[1])
+            self._memory.pop(key, None)
+
+            db = self._connect()
+            row = None
+            if db is not None:
+                try:
+                    row = db.execute('SELECT created, choices FROM responses WHERE key = ?', (key,)).fetchone()
+                    if row is not None and now - row[0] >= self.ttl:
+                        db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                        db.commit()
+                        row = None
+                except sqlite3.Error:
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+
+            choices = json.loads(row[1])
+            self._remember(key, row[0], choices)
+            self._touch(key, now)
+            self.hits += 1
+            return list(choices)
+
+    def _touch(self, key: str, now: float) -> None:
+        """Mark an entry as recently used on disk, for eviction."""
+        db = self._connect()
+        if db is None:
+            return
+        try:
+            db.execute('UPDATE responses SET used = ? WHERE key = ?', (now, key))
+            db.commit()
+        except sqlite3.Error:
+            pass
+
+    def put(self, key: str, choices: List[str]) -> None:
+        """Store the choices of a response under key."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, list(choices))
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)', (key, now, now, json.dumps(choices)))
+                self._evict(db, now)
+                db.commit()
+            except sqlite3.Error:
+                pass
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Delete expired entries, then least recently used ones until max_entries are left."""
+        db.execute('DELETE FROM responses WHERE created <= ?', (now - self.ttl,))
+        excess = db.execute('SELECT COUNT(*) FROM responses').fetchone()[0] - self.max_entries
+        if excess > 0:
+            db.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used LIMIT ?)',
+                       (excess,))
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit and miss counts so far."""
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+_default_cache: ResponseCache | None = None
+
+
+def default_response_cache() -> ResponseCache | None:
+    """Return the shared response cache, or None if caching is turned off."""
+    global _default_cache
+    if not caching_enabled():
+        return None
+    path = cache_root() / 'responses.sqlite3'
+    if _default_cache is None or _default_cache.path != path:
+        _default_cache = ResponseCache(path)
+    return _default_cache
@@ -1,5 +1,5 @@
 import re
-from tools import load_plan
+from tools import count_plan_changes
 
 
 def score(output: str, spec: dict) -> float:
@@ -8,7 +8,7 @@ def score(output: str, spec: dict) -> float:
     
     Returns a score out of 100 points:
     - 40 pts if output starts with "Summary: N change" or "Summary: N changes"
-    - 30 pts if the N matches len(load_plan(spec["plan"]))
+    - 30 pts if the N matches len(load_plan(spec["plan"])), or spec["count"] if given
     - 20 pts if user_reply=="Count only" and response is count-only
     - 10 pts if full explanations contain business-friendly language
     """
@@ -23,7 +23,7 @@ def score(output: str, spec: dict) -> float:
         number_match = re.match(r"^Summary: (\d+) changes?", output)
         if number_match:
             summary_count = int(number_match.group(1))
-            actual_count = len(load_plan(spec["plan"]))
+            actual_count = spec["count"] if "count" in spec else count_plan_changes(spec["plan"], verify=False).total
             if summary_count == actual_count:
                 total_score += 30
     except Exception:
@@ -0,0 +1,62 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+# Sessions kept at once; the least recently used go first
+DEFAULT_MAX_SESSIONS = 64
+# Seconds a session is kept after its last use
+DEFAULT_TTL = 3600
+
+
+class SessionStore:
+    """
+    In-memory sessions by id, e.g. a Conversation per MCP client conversation.
+
+    Sessions are dropped once idle for ttl seconds, and the least recently used
+    ones when more than max_sessions are open. Safe to use from several threads.
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, ttl: float = DEFAULT_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, value: Any) -> str:
+        """Store a new session and return its id."""
+        session_id = secrets.token_hex(16)
+        with self._lock:
+            self._expire()
+            self._sessions[session_id] = (time.monotonic(), value)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id: str) -> Any:
+        """Return a session, marking it used, or None if it is unknown or has expired."""
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (time.monotonic(), entry[1])
+            self._sessions.move_to_end(session_id)
+            return entry[1]
+
+    def close(self, session_id: str) -> None:
+        """Drop a session, if it is still open."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _expire(self) -> None:
+        # Entries are in order of last use, so the expired ones are at the front
+        deadline = time.monotonic() - self.ttl
+        while self._sessions and next(iter(self._sessions.values()))[0] < deadline:
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire()
+            return len(self._sessions)
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Give each test its own cache directory, so cached parses and model replies don't leak between tests."""
+    monkeypatch.setenv('TERRA_AGENT_CACHE_DIR', str(tmp_path / 'cache'))
@@ -1,4 +1,8 @@
 import json
+import random
+import re
+import threading
+import time
 import pytest
 from unittest.mock import patch, MagicMock
 import sys
@@ -6,7 +10,12 @@ from pathlib import Path
 
 # Add parent directory to path to import modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from agent import run_agent_single, build_context, BOT_PROMPT
+from agent import (
+    run_agent_single, run_agent_stream, build_context, explain_resource_changes, explain_tool_output, partition_changes,
+    BOT_PROMPT,
+)
+from parser_bench import generate_plan
+from plan_table import PlanTable
 from reward import score
 
 
@@ -76,7 +85,7 @@ def test_agent_scenarios(prompts_data, spec_name):
 def test_build_context():
     """Test the MCP context building function."""
     system = "Test system prompt"
-    tool_output = [f"- item {i}" for i in range(15)]  # More than 10 items
+    tool_output = [f"- create aws_instance.web[{i}]" for i in range(15)]
     history = [{"role": "user", "content": f"turn {i}"} for i in range(5)]  # More than 2 turns
     
     context_json = build_context(system, tool_output, history)
@@ -86,14 +95,76 @@ def test_build_context():
     assert context["mcp_version"] == "1.0"
     assert context["system"] == system
     
-    # Check tool_output pruning (should have exactly 10 items with "+6 more…" prefix)
-    assert len(context["tool_output"]) == 10
-    assert context["tool_output"][0] == "+6 more…"
+    # Small outputs fit the default token budget whole
+    assert context["tool_output"] == tool_output
+    
+    # Bullets past a small budget collapse into "+N more…", with destroys kept first
+    tool_output.append("- delete aws_db_instance.main")
+    context = json.loads(build_context(system, tool_output, history, token_budget=80))
+    assert re.fullmatch(r"\+(\d+) more… \(\1 create\)", context["tool_output"][0])
+    assert "- delete aws_db_instance.main" in context["tool_output"]
     
     # Check history pruning (should have exactly 2 items)
     assert len(context["history"]) == 2
 
 
+def test_messages_share_a_prefix_across_turns():
+    """Test that both turns send the system prompt and plan first, unchanged, with history after them."""
+    first, second = MagicMock(), MagicMock()
+    first.choices[0].message.content = "Count only or full summary?"
+    second.choices[0].message.content = "Summary: 11 changes"
+    client = MagicMock()
+    client.chat.completions.create.side_effect = [first, second]
+
+    assert explain_tool_output([f"- create aws_instance.web[{i}]" for i in range(11)], "Full summary",
+                               client=client) == "Summary: 11 changes"
+
+    calls = [call.kwargs["messages"] for call in client.chat.completions.create.call_args_list]
+    assert calls[0][0] == {"role": "system", "content": BOT_PROMPT}
+    assert calls[1][:2] == calls[0]
+    assert calls[1][2:] == [
+        {"role": "assistant", "content": "Count only or full summary?"},
+        {"role": "user", "content": "Full summary"},
+    ]
+
+
+def test_map_reduce_for_large_plans():
+    """Test that large plans are summarized part by part, concurrently, then merged with the exact count."""
+    table = PlanTable.from_text(generate_plan(random.Random(3), 900))
+    parts = partition_changes(table)
+    assert all(len(rows) <= 200 for _, rows in parts)
+    assert sorted(i for _, rows in parts for i in rows) == list(range(len(table)))
+    
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, peak
+    
+    def create(model, messages, temperature):
+        response = MagicMock()
+        if messages[0]["content"] == BOT_PROMPT:
+            response.choices[0].message.content = f"Summary: {len(table)} changes"
+            return response
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        response.choices[0].message.content = "Creating things"
+        return response
+    
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    output = explain_resource_changes(table, "Full summary", client=client)
+    
+    assert output == f"Summary: {len(table)} changes"
+    assert in_flight[1] > 1
+    calls = [call.kwargs["messages"] for call in client.chat.completions.create.call_args_list]
+    assert len(calls) == len(parts) + 1
+    reduce_input = json.loads(calls[-1][1]["content"])
+    assert reduce_input["total_changes"] == len(table) == sum(reduce_input["changes_by_action"].values())
+    assert len(reduce_input["partial_summaries"]) == len(parts)
+
+
 def test_score_function():
     """Test the scoring function with known inputs."""
     # Test case 1: Perfect score for small plan with explanations
@@ -117,4 +188,37 @@ def test_score_function():
     output = "Summary: 11 changes"
     
     test_score = score(output, spec)
-    assert test_score >= 90  # Should get full points
\ No newline at end of file
+    assert test_score >= 90  # Should get full points
+
+
+def test_count_only_reads_the_summary_line_alone():
+    """Test that count-only answers and scoring take the summary line without scanning the headers."""
+    with patch("tools.scan_blocks", side_effect=AssertionError("headers scanned")):
+        assert run_agent_single("fixtures/plan_large.txt", user_reply="Count only") == "Summary: 11 changes"
+        assert score("Summary: 11 changes", {"plan": "fixtures/plan_large.txt", "user_reply": "Count only"}) >= 90
+
+
+def test_run_agent_stream_warms_up_before_eof():
+    """Test that the API connection is warmed up while the plan is still arriving."""
+    lines = (Path(__file__).parent.parent / "fixtures" / "plan_small.txt").read_text().splitlines(keepends=True)
+    warmed_up = threading.Event()
+    
+    def stream():
+        yield from lines
+        # terraform is still "running" until the warm-up request has gone out
+        assert warmed_up.wait(timeout=5)
+    
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = "Summary: 3 changes"
+    
+    with patch('agent.OpenAI') as mock_openai:
+        mock_client = mock_openai.return_value
+        mock_client.with_options.return_value.models.list.side_effect = lambda: warmed_up.set()
+        mock_client.chat.completions.create.return_value = mock_response
+        
+        output = run_agent_stream(stream())
+    
+    assert output == "Summary: 3 changes"
+    context = json.loads(mock_client.chat.completions.create.call_args.kwargs["messages"][1]["content"])
+    assert context["tool_output"][0] == "- create aws_instance.web (type: t2.micro)"
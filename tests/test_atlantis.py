@@ -0,0 +1,80 @@
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from agent import format_project_results, run_agent_projects
+from atlantis import is_atlantis_comment, split_projects
+from tools import parse_terraform_plan_text
+
+FIXTURES = Path(__file__).parent.parent / "fixtures"
+
+
+def test_split_projects():
+    """Test that each Atlantis project heading starts its own section."""
+    plan_text = (FIXTURES / "plan_atlantis.md").read_text()
+    assert is_atlantis_comment(plan_text)
+
+    sections = split_projects(plan_text)
+    assert [(s.name, s.dir, s.workspace) for s in sections] == [
+        ("network", "network", "default"),
+        ("redis-stg", "cache", "staging"),
+    ]
+    assert [len(parse_terraform_plan_text(s.text)) for s in sections] == [3, 1]
+
+    # Plain plans are a single unnamed section
+    plain = (FIXTURES / "plan_large.txt").read_text()
+    assert not is_atlantis_comment(plain)
+    assert [s.text for s in split_projects(plain)] == [plain]
+
+
+def test_run_agent_projects_concurrently():
+    """Test that projects are explained in parallel and reported in order in one response."""
+    plan_text = (FIXTURES / "plan_atlantis.md").read_text()
+    barrier = threading.Barrier(2, timeout=5)
+
+    def explain(resource_changes, user_reply, temperature, interactive, fingerprint=None):
+        # Both projects must be in flight at once to get past the barrier
+        barrier.wait()
+        return f"Summary: {len(resource_changes)} changes"
+
+    with patch("agent.explain_resource_changes", side_effect=explain):
+        results = run_agent_projects(plan_text, user_reply="Full summary")
+
+    assert [explanation for _, explanation in results] == ["Summary: 3 changes", "Summary: 1 changes"]
+    response = format_project_results(results)
+    assert response.startswith("### dir: `network` workspace: `default`\nSummary: 3 changes")
+
+    # Count-only answers come from each project's summary line
+    counts = run_agent_projects(plan_text, user_reply="Count only")
+    assert [explanation for _, explanation in counts] == ["Summary: 3 changes", "Summary: 1 change"]
+
+
+def test_run_agent_projects_asks_once():
+    """Test that the CLI's question is asked once, before fanning out, and answers every project."""
+    resources = "".join(
+        f"  # aws_instance.web{i} will be created\n"
+        f"  + resource \"aws_instance\" \"web{i}\" {{\n"
+        f"      + instance_type = \"t{i}.micro\"\n"
+        f"    }}\n\n"
+        for i in range(6)
+    )
+    project = "```diff\nTerraform will perform the following actions:\n\n" + resources + "```\n"
+    plan_text = (
+        "Ran Plan for 2 projects:\n\n"
+        "### 1. dir: `app` workspace: `staging`\n" + project + "\n---\n"
+        "### 2. dir: `web` workspace: `staging`\n" + project.replace("t5.micro", "t5.large")
+    )
+
+    with patch("builtins.input", return_value="Full summary") as ask, \
+            patch("agent.explain_resource_changes", return_value="Summary: 6 changes") as explain:
+        results = run_agent_projects(plan_text, interactive=True)
+    assert ask.call_count == 1
+    assert [call.args[1] for call in explain.call_args_list] == ["Full summary"] * 2
+    assert [explanation for _, explanation in results] == ["Summary: 6 changes"] * 2
+
+    with patch("builtins.input", return_value="Count only"):
+        counts = run_agent_projects(plan_text, interactive=True)
+    assert [explanation for _, explanation in counts] == ["Summary: 6 changes"] * 2
@@ -4,13 +4,18 @@ Test script for Best-of-N selection functionality.
 Demonstrates how the reward function can select the best output from multiple attempts.
 """
 
+import asyncio
 import json
 import sys
+import time
 from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
 
 # Add parent directory to path to import modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from agent import run_agent_best_of_n, run_agent_single
+import agent
+from agent import run_agent_best_of_n, run_agent_best_of_n_async, run_agent_single
 from reward import score
 
 
@@ -72,6 +77,114 @@ def test_best_of_n_large_plan():
         print()
 
 
+class FakeAsyncClient:
+    """Stands in for AsyncOpenAI: each completion takes delay seconds and returns the next reply."""
+
+    def __init__(self, replies, delay=0.2):
+        self.replies = iter(replies)
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, temperature, n=1):
+        self.calls.append((messages, n))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=next(self.replies)))
+                                        for _ in range(n)])
+
+
+def test_best_of_n_samples_run_concurrently():
+    """Test that best-of-N fans the samples out at once and still returns (best, score, all)."""
+    explanation = "\n".join(["Summary: 3 changes", "", "1. Creating an EC2 instance (aws_instance.web)"])
+    client = FakeAsyncClient(["Summary: 2 changes", explanation, "Summary: 3 changes", "Here you go", explanation])
+
+    start = time.perf_counter()
+    best_response, best_score, all_responses = asyncio.run(run_agent_best_of_n_async(
+        "fixtures/plan_small.txt", n=5, temperature=0.8, max_concurrency=5, client=client
+    ))
+    elapsed = time.perf_counter() - start
+
+    assert client.peak == 5
+    assert elapsed < 0.2 * 3
+    assert best_response == explanation
+    assert best_score == 100
+    assert len(all_responses) == 5
+    assert [s for _, s in all_responses] == sorted((s for _, s in all_responses), reverse=True)
+
+
+def test_best_of_n_prepares_the_plan_once():
+    """Test that the samples share one load, render and count of the plan, and one conversation prefix."""
+    explanation = "\n".join(["Summary: 3 changes", "", "1. Creating an EC2 instance (aws_instance.web)"])
+    client = FakeAsyncClient([explanation] * 4, delay=0)
+
+    with patch("agent.load_plan_table_cached", wraps=agent.load_plan_table_cached) as load, \
+            patch("agent.render_tool_output", wraps=agent.render_tool_output) as render, \
+            patch("reward.count_plan_changes") as count:
+        best_response, best_score, _ = asyncio.run(run_agent_best_of_n_async(
+            "fixtures/plan_small.txt", n=4, temperature=0.8, client=client
+        ))
+    assert best_response == explanation and best_score == 100
+    assert load.call_count == 1 and render.call_count == 1 and count.call_count == 0
+    assert all(messages[:2] == client.calls[0][0][:2] for messages, _ in client.calls)
+
+
+def test_best_of_n_choices_from_one_request():
+    """Test that the choices strategy asks for all N in one request, and answers the question once per group."""
+    question = "Count only or full summary?"
+    explanation = "\n".join(["Summary: 11 changes", "", "1. Creating EC2 instances (aws_instance.web)"])
+    client = FakeAsyncClient([question, "Summary: 11 changes", question, question, explanation, "Summary: 11", "x"],
+                             delay=0)
+
+    best_response, best_score, all_responses = asyncio.run(run_agent_best_of_n_async(
+        "fixtures/plan_large.txt", n=4, user_reply="Full summary", client=client, strategy="choices"
+    ))
+
+    assert [n for _, n in client.calls] == [4, 3]
+    assert client.calls[1][0][-2:] == [
+        {"role": "assistant", "content": question},
+        {"role": "user", "content": "Full summary"},
+    ]
+    assert best_response == explanation and best_score == 100
+    assert sorted(response for response, _ in all_responses) == sorted(
+        [explanation, "Summary: 11 changes", "Summary: 11", "x"]
+    )
+
+
+def test_best_of_n_early_exit():
+    """Test that early exit stops launching and cancels samples once one hits the target, or at the deadline."""
+    explanation = "\n".join(["Summary: 3 changes", "", "1. Creating an EC2 instance (aws_instance.web)"])
+    client = FakeAsyncClient([explanation] * 5, delay=0.1)
+
+    best_response, best_score, all_responses = asyncio.run(run_agent_best_of_n_async(
+        "fixtures/plan_small.txt", n=5, temperature=0.8, client=client, strategy="early_exit"
+    ))
+    assert best_score == 100 and best_response == explanation
+    # Only the first two were ever started
+    assert len(client.calls) == 2
+    assert 1 <= len(all_responses) <= 2
+
+    # min_samples waits for more responses before stopping
+    client = FakeAsyncClient([explanation] * 5, delay=0.1)
+    _, _, all_responses = asyncio.run(run_agent_best_of_n_async(
+        "fixtures/plan_small.txt", n=5, client=client, strategy="early_exit", min_samples=3
+    ))
+    assert len(all_responses) >= 3 and len(client.calls) <= 4
+
+    # At the deadline, samples in flight are cancelled
+    client = FakeAsyncClient([explanation] * 5, delay=5)
+    start = time.perf_counter()
+    best_response, best_score, all_responses = asyncio.run(run_agent_best_of_n_async(
+        "fixtures/plan_small.txt", n=5, client=client, deadline=0.1
+    ))
+    assert time.perf_counter() - start < 1
+    assert best_score == 0 and all_responses == []
+
+
 def compare_single_vs_best_of_n():
     """Compare single shot vs Best-of-N selection."""
     print("=" * 60)
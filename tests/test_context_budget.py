@@ -0,0 +1,59 @@
+import json
+import random
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from agent import change_details, render_tool_output
+from context_budget import bullet_cost, bullet_weight, change_priority, family_address, merge_values
+from parser_bench import generate_plan
+from plan_table import PlanTable
+
+
+def test_render_tool_output_within_budget():
+    """Test that bullets are packed into the budget, most important first, rendering details only for those."""
+    table = PlanTable.from_text(generate_plan(random.Random(1), 2000))
+
+    with patch("agent.change_details", side_effect=change_details) as details:
+        tool_output = render_tool_output(table, token_budget=500)
+    assert sum(bullet_cost(line) for line in tool_output) <= 500
+    assert details.call_count < 100
+
+    # Everything left out is accounted for in the "+N more…" line
+    omitted = int(tool_output[0].split()[0][1:])
+    assert omitted + sum(bullet_weight(line) for line in tool_output[1:]) == len(table)
+
+    # No change left out outranks one that made it in
+    kept = {line.split()[2] for line in tool_output[1:] if bullet_weight(line) == 1}
+    priorities = [change_priority(table.value("action", i), table.value("type", i)) for i in range(len(table))]
+    worst_kept = max(p for i, p in enumerate(priorities) if table.address(i) in kept)
+    assert all(p >= worst_kept for i, p in enumerate(priorities) if table.address(i) not in kept)
+
+    # The context doesn't grow with the plan
+    bigger = PlanTable.from_text(generate_plan(random.Random(2), 8000))
+    assert len(json.dumps(render_tool_output(bigger, token_budget=500))) <= len(json.dumps(tool_output)) * 1.5
+
+
+def test_instance_families_collapse():
+    """Test that count/for_each instances with the same action share one bullet, keeping their differences."""
+    lines = ["Terraform will perform the following actions:", ""]
+    for i in range(200):
+        lines += [
+            f"  # aws_instance.web[{i}] will be created",
+            '  + resource "aws_instance" "web" {',
+            '      + instance_type = "t2.micro"',
+            f'      + name          = "web-{i}"',
+            "    }",
+            "",
+        ]
+    lines += ["  # aws_instance.web[200] will be destroyed", '  - resource "aws_instance" "web" {', "    }", ""]
+    tool_output = render_tool_output(PlanTable.from_text("\n".join(lines)))
+    assert tool_output == [
+        "- create aws_instance.web[0..199] (name: web-{0..199}, type: t2.micro) ×200",
+        "- delete aws_instance.web[200]",
+    ]
+
+    assert family_address(['aws_s3_bucket.logs["a"]', 'aws_s3_bucket.logs["b"]']) == 'aws_s3_bucket.logs["a","b"]'
+    assert merge_values(["t2.micro", "t2.large", "t2.micro"]) == "t2.micro | t2.large"
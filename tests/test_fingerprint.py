@@ -0,0 +1,103 @@
+import io
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from agent import explain_plan_text, run_agent_projects
+from fingerprint import normalize_value, plan_fingerprint
+from plan_table import PlanTable
+from tools import iter_resource_changes_stream, parse_terraform_plan_text
+
+PREAMBLE = "Terraform will perform the following actions:\n\n"
+WEB = """  # aws_instance.web will be created
+  + resource "aws_instance" "web" {
+      + instance_type = "t2.micro"
+      + tags          = {
+          + "BuiltAt" = "2024-05-01T10:00:00Z"
+        }
+    }
+"""
+UPDATE = """  # google_storage_bucket_iam_binding.readers will be updated in-place
+  ~ resource "google_storage_bucket_iam_binding" "readers" {
+        id      = "b/readers"
+      ~ members = [
+          + "serviceAccount:ci@example.iam.gserviceaccount.com",
+            # (2 unchanged elements hidden)
+        ]
+    }
+"""
+DB = """  # aws_db_instance.main will be destroyed
+  - resource "aws_db_instance" "main" {
+      - id                = "db-3f2504e04f8911d3"
+      - identifier        = "prod-db"
+    }
+"""
+
+
+def test_fingerprint_ignores_cosmetic_differences():
+    """Test that ordering, spacing, colors, timestamps and ids don't change the fingerprint, but changes do."""
+    fingerprint = plan_fingerprint(parse_terraform_plan_text(PREAMBLE + WEB + "\n" + DB))
+
+    reordered = PREAMBLE + DB + "\n" + WEB
+    assert plan_fingerprint(parse_terraform_plan_text(reordered)) == fingerprint
+    rerun = (PREAMBLE + WEB.replace("2024-05-01T10:00:00Z", "2024-06-12T08:30:15Z") + "\n"
+             + DB.replace("db-3f2504e04f8911d3", "db-0a1b2c3d4e5f6071").replace('"prod-db"', '"prod-db"   '))
+    assert plan_fingerprint(parse_terraform_plan_text(rerun)) == fingerprint
+    assert normalize_value("\x1b[1maws_instance.web\x1b[0m  i-0123456789abcdef0") == "aws_instance.web i-<id>"
+
+    assert plan_fingerprint(parse_terraform_plan_text(PREAMBLE + WEB.replace("t2.micro", "t3.large") + "\n" + DB)) \
+        != fingerprint
+    assert plan_fingerprint(parse_terraform_plan_text(PREAMBLE + WEB)) != fingerprint
+
+    # Only real ids are volatile; names that look generated are compared as they are
+    for name, other in [("logs-20240101", "logs-20240102"), ("backup-0badc0de", "backup-0badc0df")]:
+        assert plan_fingerprint(parse_terraform_plan_text(PREAMBLE + DB.replace("prod-db", name))) != \
+            plan_fingerprint(parse_terraform_plan_text(PREAMBLE + DB.replace("prod-db", other)))
+    assert normalize_value('+ vpc_id = "vpc-0a1b2c3d" + arn = "arn:aws:rds:db"') == '+ vpc_id = "vpc-<id>" + arn = <id>'
+
+
+def test_fingerprint_does_not_depend_on_how_the_plan_was_loaded():
+    """Test that a table, a streamed list and a list with decoded rows of one plan share a fingerprint."""
+    plan_text = PREAMBLE + WEB + "\n" + UPDATE + "\n" + DB
+    fingerprint = plan_fingerprint(PlanTable.from_text(plan_text))
+    assert plan_fingerprint(list(iter_resource_changes_stream(io.StringIO(plan_text)))) == fingerprint
+
+    resource_changes = parse_terraform_plan_text(plan_text)
+    assert plan_fingerprint(resource_changes) == fingerprint
+    # Rows aren't decoded by fingerprinting them, and decoding them doesn't change it
+    assert all(change.change.after._attributes is None for change in resource_changes)
+    for change in resource_changes:
+        dict(change.change.after)
+        list(change.change.deltas or [])
+    assert plan_fingerprint(resource_changes) == fingerprint
+
+
+def test_explanations_are_cached_by_fingerprint():
+    """Test that a reordered copy of a plan is answered from the cache, and the fingerprint is reported."""
+    client = MagicMock()
+    client.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content="Summary: 2 changes"))]
+    )
+    report = io.StringIO()
+    with patch("agent.OpenAI", return_value=client):
+        assert explain_plan_text(PREAMBLE + WEB + "\n" + DB, report=report) == "Summary: 2 changes"
+        assert explain_plan_text(PREAMBLE + DB + "\n" + WEB) == "Summary: 2 changes"
+    assert client.chat.completions.create.call_count == 1
+    fingerprint = plan_fingerprint(parse_terraform_plan_text(PREAMBLE + WEB + "\n" + DB))
+    assert report.getvalue() == f"plan_fingerprint: {fingerprint}\n"
+
+
+def test_identical_projects_are_explained_once():
+    """Test that Atlantis projects with the same plan fingerprint share one explanation."""
+    project = "```diff\n" + PREAMBLE + WEB + "```\n"
+    plan_text = (
+        "Ran Plan for 2 projects:\n\n"
+        "### 1. dir: `app` workspace: `staging`\n" + project + "\n---\n"
+        "### 2. dir: `app` workspace: `production`\n" + project
+    )
+    with patch("agent.explain_resource_changes", return_value="Summary: 1 change") as explain:
+        results = run_agent_projects(plan_text, user_reply="Full summary")
+    assert [explanation for _, explanation in results] == ["Summary: 1 change"] * 2
+    assert explain.call_count == 1
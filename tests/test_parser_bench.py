@@ -0,0 +1,45 @@
+import random
+import sys
+from pathlib import Path
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from parser_bench import NORMALIZERS, PARSERS, fuzz, generate_plan, load_parser, throughput
+from tools import count_changes, parse_terraform_plan_text
+
+
+def test_generated_plans_are_realistic():
+    """Test that generated plans are deterministic per seed and agree with their summary line."""
+    plan_text = generate_plan(random.Random(7), 40)
+    assert plan_text == generate_plan(random.Random(7), 40)
+    assert len(parse_terraform_plan_text(plan_text)) == 40
+    assert count_changes(plan_text, verify=False).to_change == plan_text.count(" will be updated in-place")
+
+
+def test_parsers_agree_with_reference():
+    """Test that every built-in parser matches the reference on a few generated plans."""
+    reference = load_parser("text")
+    for name in PARSERS.keys() - {"legacy"}:
+        assert fuzz(reference, load_parser(name), seeds=5, resources=15) == [], name
+
+    # Differences are reported with the seed that produced them
+    failures = fuzz(reference, lambda plan_text: parse_terraform_plan_text(plan_text)[1:], seeds=3, resources=5, start_seed=1)
+    assert failures and all("resource" in difference for _, difference in failures)
+
+    # The legacy parser agrees once the intended differences are normalized, and only then
+    legacy = load_parser("legacy")
+    assert fuzz(legacy, reference, seeds=20, resources=15, normalize=NORMALIZERS["legacy"]) == []
+    assert fuzz(legacy, reference, seeds=20, resources=15)
+
+    # Attributes of blocks with heredoc or jsonencode values are still compared
+    def drop_names(plan_text):
+        resource_changes = parse_terraform_plan_text(plan_text)
+        for resource_change in resource_changes:
+            after = resource_change.change.after
+            if after is not None and {"user_data", "policy"} & set(after):
+                resource_change.change.after = {key: value for key, value in after.items() if key != "name"}
+        return resource_changes
+    assert fuzz(legacy, drop_names, seeds=50, resources=15, normalize=NORMALIZERS["legacy"])
+
+    mb_per_s, resources_per_s = throughput(reference, generate_plan(random.Random(0), 50), repeat=1)
+    assert mb_per_s > 0 and resources_per_s > 0
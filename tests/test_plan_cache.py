@@ -0,0 +1,86 @@
+import gzip
+import sys
+from pathlib import Path
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from unittest.mock import patch
+
+from plan_cache import PlanCache, load_plan_table_cached, parse_plan_table_cached
+from plan_table import PlanTable
+from tools import LazyAttributes, load_plan
+
+FIXTURES = Path(__file__).parent.parent / "fixtures"
+
+
+def test_cache_round_trip(tmp_path):
+    """Test that a cached plan comes back identical and skips parsing."""
+    cache = PlanCache(tmp_path)
+    path = str(FIXTURES / "plan_large.txt")
+
+    first = load_plan_table_cached(path, cache)
+    with patch("plan_cache.load_plan_table", side_effect=AssertionError("parsed again")), \
+            patch.object(PlanTable, "from_buffer", side_effect=AssertionError("parsed again")):
+        second = load_plan_table_cached(path, cache)
+        # Text payloads with the same bytes share the entry
+        from_text = parse_plan_table_cached((FIXTURES / "plan_large.txt").read_text(), cache)
+    assert list(second) == load_plan(path)
+    assert isinstance(second[0].change.after, LazyAttributes)  # still decoded on access
+    assert second.counts("action") == first.counts("action")
+    assert second.modules.root.counts("type") == first.modules.root.counts("type")
+    assert list(from_text) == list(second)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # Digests of large values keep their full value
+    blobs = str(FIXTURES / "plan_blobs.txt")
+    load_plan_table_cached(blobs, cache)
+    cached = load_plan_table_cached(blobs, cache)
+    assert list(cached) == load_plan(blobs)
+    assert cached[0].change.after["user_data"].expand() == load_plan(blobs)[0].change.after["user_data"].expand()
+
+
+def test_cache_json_values_and_corrupt_entries(tmp_path):
+    """Test that JSON plan values survive caching and corrupt entries count as misses."""
+    cache = PlanCache(tmp_path)
+    plan_json = (FIXTURES / "plan_small.json").read_text()
+    key = PlanCache.key(plan_json.encode())
+
+    parse_plan_table_cached(plan_json, cache)
+    assert cache.get(key)[0].change.after["tags"] is None
+
+    entry = next(tmp_path.iterdir())
+    entry.write_bytes(b"garbage")
+    assert cache.get(key) is None
+    assert not entry.exists()
+
+
+def test_cache_streams_compressed_plans(tmp_path):
+    """Test that compressed plans are decompressed as a stream, never whole, and not cached."""
+    cache = PlanCache(tmp_path / "cache")
+    path = tmp_path / "plan.txt.gz"
+    path.write_bytes(gzip.compress((FIXTURES / "plan_large.txt").read_bytes()))
+
+    with patch("gzip.GzipFile.read", side_effect=AssertionError("decompressed whole")):
+        from_file = load_plan_table_cached(str(path), cache)
+        from_payload = parse_plan_table_cached(path.read_bytes(), cache)
+    assert list(from_file) == list(from_payload) == load_plan(str(FIXTURES / "plan_large.txt"))
+    assert not (tmp_path / "cache").exists()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Test that writes evict the oldest entries once the size bound is exceeded."""
+    cache = PlanCache(tmp_path, max_bytes=0)
+    changes = load_plan(str(FIXTURES / "plan_small.txt"))
+    cache.put("a", changes)
+    cache.put("b", changes)
+    assert cache.get("a") is None
+
+    cache = PlanCache(tmp_path, max_bytes=10 ** 6)
+    cache.put("c", changes)
+    assert list(cache.get("c")) == changes
+
+    # Entries of text plans need the plan bytes to read rows from
+    data = (FIXTURES / "plan_small.txt").read_bytes()
+    cache.put("d", PlanTable.from_buffer(data))
+    assert cache.get("d") is None
+    assert list(cache.get("d", lambda: data)) == changes
@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from plan_table import PlanTable, load_plan_table, module_path
+from tools import load_plan
+
+FIXTURES = Path(__file__).parent.parent / "fixtures"
+
+
+def test_rows_match_load_plan():
+    """Test that the lazy ResourceChange views equal the parser's models."""
+    for fixture in ["plan_small.txt", "plan_large.txt", "plan_redis_stg.txt"]:
+        path = str(FIXTURES / fixture)
+        table = load_plan_table(path)
+        assert list(table) == load_plan(path)
+        assert table[-1] == table[len(table) - 1]
+        table.close()
+
+
+def test_counts_and_group_by():
+    """Test the per-column aggregates on the large fixture."""
+    table = load_plan_table(str(FIXTURES / "plan_large.txt"))
+
+    assert table.counts("action") == {"update": 1, "create": 10}
+    assert table.counts("type")["aws_instance"] == 2
+    assert table.counts("module") == {"module.company_media_optimize_production": 1, "": 10}
+
+    groups = table.group_by("type")
+    assert [table.address(i) for i in groups["aws_instance"]] == ["aws_instance.web[0]", "aws_instance.web[1]"]
+
+
+def test_from_text_and_module_path():
+    """Test building from text, including fallback headers and nested modules."""
+    table = PlanTable.from_text("# module.a.module.b.aws_vpc.main will be destroyed")
+    assert len(table) == 1
+    assert table.value("action", 0) == "delete"
+    assert table.value("module", 0) == "module.a.module.b"
+    assert table[0].change.after is None
+
+    assert module_path("aws_vpc.main") == ""
+    assert module_path("module.a.aws_vpc.main") == "module.a"
+    assert not PlanTable.from_text("")
+
+
+def test_json_plan_table():
+    """Test that JSON plans load into a table with normalized actions and real values."""
+    table = load_plan_table(str(FIXTURES / "plan_small.json"))
+    assert len(table) == 3
+    assert table.counts("action") == {"create": 3}
+    assert table[0].change.after["instance_type"] == "t2.micro"
+    assert table.address(2) == "aws_s3_bucket.storage"
+
+
+def test_module_index():
+    """Test per-module counts, including nested modules and for_each keys containing dots."""
+    plan_text = "\n\n".join([
+        "  # aws_vpc.main will be created",
+        "  # module.net.aws_subnet.a will be created",
+        '  # module.net.module.dns["example.com"].aws_route53_record.www will be updated in-place',
+        '  # module.net.module.dns["example.org"].aws_route53_record.www will be destroyed',
+        "  # module.app[0].aws_instance.web will be created",
+        "",
+    ])
+    table = PlanTable.from_text("\n" + plan_text)
+    modules = table.modules
+
+    assert modules.root.total == 5
+    assert modules.counts("", "action") == {"create": 3, "update": 1, "delete": 1}
+    assert modules.counts("module.net", "type") == {"aws_subnet": 1, "aws_route53_record": 2}
+    assert modules.node("module.net").direct == 1
+
+    # A keyed module call has a node for the call and one per instance
+    assert modules.node("module.net.module.dns").total == 2
+    assert modules.counts('module.net.module.dns["example.com"]') == {"update": 1}
+    assert table.value("type", 2) == "aws_route53_record"
+    assert table[2].name == "www"
+    assert modules.node("module.app[0]").total == 1
+    assert modules.node("module.missing") is None
+
+    assert [node.path for node in modules.walk()] == [
+        "", "module.net", "module.net.module.dns", 'module.net.module.dns["example.com"]',
+        'module.net.module.dns["example.org"]', "module.app", "module.app[0]",
+    ]
+
@@ -0,0 +1,62 @@
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from agent import Conversation, explain_tool_output
+from response_cache import ResponseCache
+
+
+def test_response_cache_hits_expiry_and_eviction(tmp_path):
+    """Test that responses survive a new cache on the same file, expire, and are evicted least recently used first."""
+    path = tmp_path / 'responses.sqlite3'
+    cache = ResponseCache(path, max_entries=2)
+    messages = [{"role": "user", "content": "plan"}]
+    key = ResponseCache.key("gpt-4o-mini", 0, messages)
+    assert key != ResponseCache.key("gpt-4o-mini", 0.7, messages)
+    assert key != ResponseCache.key("gpt-4o-mini", 0, [{"role": "user", "content": "plan "}])
+
+    assert cache.get(key) is None
+    cache.put(key, ["Summary: 3 changes"])
+    assert cache.get(key) == ["Summary: 3 changes"]
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+    # From disk, in another process's cache
+    reopened = ResponseCache(path, max_entries=2)
+    assert reopened.get(key) == ["Summary: 3 changes"]
+
+    # Past max_entries, the least recently used goes
+    reopened.put("b", ["b"])
+    reopened.get(key)
+    reopened.put("c", ["c"])
+    fresh = ResponseCache(path)
+    assert fresh.get("b") is None
+    assert fresh.get(key) == ["Summary: 3 changes"] and fresh.get("c") == ["c"]
+
+    expiring = ResponseCache(path, ttl=0.1)
+    time.sleep(0.2)
+    assert expiring.get(key) is None
+
+
+def test_deterministic_requests_are_answered_from_cache():
+    """Test that a repeated temperature 0 conversation makes no requests, and sampled ones always do."""
+    client = MagicMock()
+    client.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content="Summary: 1 changes"))]
+    )
+    tool_output = ["- create aws_s3_bucket.logs"]
+
+    assert explain_tool_output(tool_output, client=client) == "Summary: 1 changes"
+    assert explain_tool_output(tool_output, client=client) == "Summary: 1 changes"
+    assert client.chat.completions.create.call_count == 1
+
+    # Another plan is another request
+    explain_tool_output(["- delete aws_s3_bucket.logs"], client=client)
+    assert client.chat.completions.create.call_count == 2
+
+    # Sampling isn't cached
+    Conversation(tool_output, client=client, temperature=0.7).send()
+    Conversation(tool_output, client=client, temperature=0.7).send()
+    assert client.chat.completions.create.call_count == 4
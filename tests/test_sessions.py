@@ -0,0 +1,51 @@
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from agent import BOT_PROMPT, Conversation
+from sessions import SessionStore
+
+
+def test_session_store_expires_and_evicts():
+    """Test that sessions are found by id until idle too long or pushed out by newer ones."""
+    store = SessionStore(max_sessions=2, ttl=0.2)
+    first = store.create("first")
+    second = store.create("second")
+    assert store.get(first) == "first"
+
+    # The least recently used session goes first
+    third = store.create("third")
+    assert store.get(second) is None
+    assert store.get(first) == "first" and store.get(third) == "third"
+
+    time.sleep(0.3)
+    assert store.get(first) is None
+    assert len(store) == 0
+
+
+def test_conversation_follow_ups_send_only_the_new_message():
+    """Test that every turn reuses the plan prefix and carries only the pruned history after it."""
+    client = MagicMock()
+    replies = iter(["Count only or full summary?", "Summary: 2 changes\n...", "The bucket is new."])
+    client.chat.completions.create.side_effect = lambda **kwargs: MagicMock(
+        choices=[MagicMock(message=MagicMock(content=next(replies)))]
+    )
+    conversation = Conversation(["- create aws_s3_bucket.logs", "- create aws_instance.web"], client=client)
+    store = SessionStore()
+    session_id = store.create(conversation)
+
+    assert conversation.send() == "Count only or full summary?"
+    assert store.get(session_id).send("Full summary").startswith("Summary: 2 changes")
+    assert store.get(session_id).send("Why the bucket?") == "The bucket is new."
+
+    calls = [call.kwargs["messages"] for call in client.chat.completions.create.call_args_list]
+    assert calls[0][0] == {"role": "system", "content": BOT_PROMPT}
+    assert all(messages[:2] == calls[0] for messages in calls)
+    assert calls[2][2:] == [
+        {"role": "assistant", "content": "Summary: 2 changes\n..."},
+        {"role": "user", "content": "Why the bucket?"},
+    ]
+    assert conversation.total == 2
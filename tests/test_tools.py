@@ -0,0 +1,298 @@
+import gzip
+import io
+import json
+import lzma
+import sys
+from pathlib import Path
+
+# Add parent directory to path to import modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from tools import (
+    AttributeDelta, BlobValue, LazyAttributes, LazyDeltas, chunk_boundaries, compression_format, count_changes, count_plan_changes,
+    iter_json_array, iter_resource_changes, json_resource_change, load_plan, open_plan_payload, parse_deltas, parse_plan_parallel, parse_terraform_plan_json,
+    parse_terraform_plan_text, parse_terraform_plan_text_parallel, text_chunks,
+)
+
+FIXTURES = Path(__file__).parent.parent / "fixtures"
+
+
+def test_parse_large_plan():
+    """Test parsing the large fixture, including module addresses and attributes."""
+    changes = load_plan(str(FIXTURES / "plan_large.txt"))
+    assert len(changes) == 11
+
+    binding = changes[0]
+    assert binding.address == "module.company_media_optimize_production.google_storage_bucket_iam_binding.admin[0]"
+    assert binding.type == "google_storage_bucket_iam_binding"
+    assert binding.name == "admin[0]"
+    assert binding.change.actions == ["update"]
+
+    web = changes[1]
+    assert web.change.actions == ["create"]
+    assert web.change.after == {"ami": "ami-12345678", "instance_type": "t2.micro"}
+
+    # Empty blocks have no attributes
+    gateway = next(c for c in changes if c.address == "aws_internet_gateway.gw")
+    assert gateway.change.after is None
+
+
+def test_known_after_apply_is_skipped():
+    """Test that computed attributes are not reported as values."""
+    changes = load_plan(str(FIXTURES / "plan_redis_stg.txt"))
+    assert len(changes) == 1
+    after = changes[0].change.after
+    assert after["name"] == "stg-redis-instance"
+    assert after["memory_size_gb"] == "1"
+    assert "host" not in after
+
+
+def test_iter_resource_changes_yields_before_eof():
+    """Test that a block is yielded as soon as the next header closes it."""
+    lines = [
+        "Terraform will perform the following actions:\n",
+        "\n",
+        "  # aws_instance.web will be created\n",
+        "  + resource \"aws_instance\" \"web\" {\n",
+        "      + instance_type = \"t2.micro\"\n",
+        "    }\n",
+        "\n",
+        "  # aws_s3_bucket.storage will be destroyed\n",
+    ]
+
+    def stream():
+        yield from lines
+        raise AssertionError("read past the second header")
+
+    first = next(iter_resource_changes(stream()))
+    assert first.address == "aws_instance.web"
+    assert first.change.after == {"instance_type": "t2.micro"}
+
+
+def test_fallback_headers_without_indentation():
+    """Test the looser header match used when no indented headers are present."""
+    plan_text = "# aws_instance.web will be created\n# aws_vpc.main will be destroyed"
+    changes = parse_terraform_plan_text(plan_text)
+    assert [c.address for c in changes] == ["aws_instance.web", "aws_vpc.main"]
+    assert [c.change.actions for c in changes] == [["create"], ["delete"]]
+    assert all(c.change.after is None for c in changes)
+
+    assert list(iter_resource_changes(io.StringIO(""))) == []
+
+
+def test_mmap_loading_matches_streaming(tmp_path):
+    """Test that the mmap-backed bytes parser returns the same changes as the text parser."""
+    for fixture in ["plan_small.txt", "plan_large.txt", "plan_redis_stg.txt"]:
+        path = str(FIXTURES / fixture)
+        assert load_plan(path, use_mmap=True) == load_plan(path)
+
+    empty = tmp_path / "empty.txt"
+    empty.write_text("")
+    assert load_plan(str(empty), use_mmap=True) == []
+
+
+def test_attributes_are_decoded_lazily():
+    """Test that attributes are decoded from block offsets on first access only."""
+    plan_text = (FIXTURES / "plan_redis_stg.txt").read_text()
+    after = parse_terraform_plan_text(plan_text)[0].change.after
+    assert isinstance(after, LazyAttributes)
+    assert after._attributes is None
+
+    assert after["tier"] == "BASIC"
+    decoded = after._attributes
+    assert decoded is not None and after.buffer is None
+    assert after["region"] == "us-central1"
+    assert after._attributes is decoded
+
+    # Serializes like the plain dict it stands for
+    assert parse_terraform_plan_text(plan_text)[0].model_dump()["change"]["after"] == decoded
+
+
+def test_parallel_parsing_matches_serial():
+    """Test that chunked parsing across processes keeps results and order."""
+    path = str(FIXTURES / "plan_large.txt")
+    plan_text = Path(path).read_text()
+
+    # Every chunk after the first starts on the newline opening a block header
+    boundaries = chunk_boundaries(plan_text.encode(), chunk_size=200)
+    assert len(boundaries) > 3
+    assert all(plan_text.encode()[b:b + 4] == b"\n  #" for b in boundaries[1:-1])
+
+    expected = parse_terraform_plan_text(plan_text)
+    assert parse_plan_parallel(path, workers=2, chunk_size=200) == expected
+    assert parse_terraform_plan_text_parallel(plan_text, workers=2, chunk_size=200) == expected
+
+    # Fallback headers are still found when no chunk has an indented header
+    fallback_text = "# aws_instance.web will be created\n" * 20
+    assert len(parse_terraform_plan_text_parallel(fallback_text, workers=2, chunk_size=64)) == 20
+
+
+def test_json_plan_ingest():
+    """Test that JSON plans are streamed into ResourceChanges with real before/after values."""
+    changes = load_plan(str(FIXTURES / "plan_small.json"))
+
+    # The no-op entry for aws_vpc.main is dropped, as in text plans
+    assert [c.address for c in changes] == ["aws_instance.web", "aws_security_group.web_sg", "aws_s3_bucket.storage"]
+    assert changes[0].change.actions == ["create"]
+    assert changes[0].change.before is None
+    assert changes[0].change.after == {"ami": "ami-12345678", "instance_type": "t2.micro", "tags": None}
+
+    plan_json = (FIXTURES / "plan_small.json").read_text()
+    assert parse_terraform_plan_json(plan_json) == changes
+
+
+def test_iter_json_array_across_chunk_boundaries():
+    """Test that strings, escapes and nesting split over tiny chunks are tracked correctly."""
+    document = '{"other": {"resource_changes": ["nested"], "s": "\\"]}"}, "resource_changes": [{"a": "x\\"y"}, {"b": [1, {"c": 2}]}], "after": {}}'
+    for chunk_size in (1, 2, 3, 7, 1024):
+        items = list(iter_json_array(text_chunks(document, chunk_size), "resource_changes"))
+        assert items == [{"a": 'x"y'}, {"b": [1, {"c": 2}]}]
+
+
+def test_count_changes_from_summary_line():
+    """Test counting from the "Plan:" line, with headers as a cross-check."""
+    plan_text = (FIXTURES / "plan_large.txt").read_text()
+    count = count_changes(plan_text, verify=False)
+    assert count.total == 11 and count.headers is None
+
+    for path in ["plan_small.txt", "plan_large.txt", "plan_redis_stg.txt", "plan_small.json"]:
+        count = count_plan_changes(str(FIXTURES / path))
+        assert count.total == len(load_plan(str(FIXTURES / path)))
+        assert not count.mismatch
+
+    # A summary that disagrees with the headers is flagged, and the headers win
+    tampered = plan_text.replace("Plan: ", "Plan: 1 to import, ").replace(" to add,", "0 to add,", 1)
+    count = count_changes(tampered.encode())
+    assert count.mismatch and count.total == 11 and count.to_add > 11
+
+    assert count_changes("No changes. Your infrastructure matches the configuration.").total == 0
+
+
+def test_count_changes_with_replaces_and_imports():
+    """Test that a replace (an add and a destroy to Terraform) and a pure import count as one resource each."""
+    plan_text = (
+        "Terraform will perform the following actions:\n\n"
+        "  # aws_instance.web will be replaced\n"
+        "-/+ resource \"aws_instance\" \"web\" {\n"
+        "      ~ ami = \"ami-1\" -> \"ami-2\" # forces replacement\n"
+        "    }\n\n"
+        "  # aws_s3_bucket.logs will be imported\n"
+        "    resource \"aws_s3_bucket\" \"logs\" {\n"
+        "        bucket = \"logs\"\n"
+        "    }\n\n"
+        "Plan: 1 to import, 1 to add, 0 to change, 1 to destroy.\n"
+    )
+    for buffer in (plan_text, plan_text.encode()):
+        verified = count_changes(buffer)
+        assert verified.total == 2 and not verified.mismatch
+        assert (verified.to_import, verified.to_replace, verified.imported_only) == (1, 1, 1)
+        assert count_changes(buffer, verify=False).total == 2
+
+
+def test_update_deltas():
+    """Test that nested list, map and block changes of updates are parsed into structured deltas."""
+    changes = load_plan(str(FIXTURES / "plan_large.txt"))
+    # Parsed on first access only
+    assert isinstance(changes[0].change.deltas, LazyDeltas) and changes[0].change.deltas._deltas is None
+    assert changes[0].change.deltas == [
+        AttributeDelta(path="members", op="+", after="serviceAccount:service-account@company-project.iam.gserviceaccount.com"),
+        AttributeDelta(path="members", op="#", after="3 unchanged elements hidden"),
+        AttributeDelta(path="", op="#", after="3 unchanged attributes hidden"),
+    ]
+    # Created resources carry no deltas
+    assert changes[1].change.deltas is None
+
+    body = """  ~ resource "aws_instance" "web" {
+      ~ instance_type = "t2.micro" -> "t2.large" # forces replacement
+      - monitoring    = true -> null
+      ~ tags          = {
+          ~ "Name" = "old" -> "new"
+            # (1 unchanged element hidden)
+        }
+      ~ policy        = jsonencode(
+          ~ {
+              ~ Action = "s3:Get" -> "s3:*"
+            }
+        )
+      + ebs_block_device {
+          + volume_size = 8
+        }
+    }
+"""
+    deltas = [(d.path, d.op, d.before, d.after) for d in parse_deltas(body.splitlines())]
+    assert deltas == [
+        ("instance_type", "~", "t2.micro", "t2.large"),
+        ("monitoring", "-", "true", None),
+        ("tags.Name", "~", "old", "new"),
+        ("tags", "#", None, "1 unchanged element hidden"),
+        ("policy.Action", "~", "s3:Get", "s3:*"),
+        ("ebs_block_device.volume_size", "+", None, "8"),
+    ]
+
+    # JSON plans are diffed from their before and after values
+    entry = {
+        "address": "aws_instance.web", "type": "aws_instance", "name": "web",
+        "change": {
+            "actions": ["update"],
+            "before": {"instance_type": "t2.micro", "tags": {"Name": "old"}, "sg": ["a", "b"], "id": "i-1"},
+            "after": {"instance_type": "t2.large", "tags": {"Name": "old", "Env": "prod"}, "sg": ["b", "c"]},
+            "after_unknown": {"id": True},
+        },
+    }
+    deltas = [(d.path, d.op, d.before, d.after) for d in json_resource_change(entry).change.deltas]
+    assert deltas == [
+        ("instance_type", "~", "t2.micro", "t2.large"),
+        ("tags.Env", "+", None, "prod"),
+        ("sg", "-", "a", None),
+        ("sg", "+", None, "c"),
+        ("id", "~", "i-1", "(known after apply)"),
+    ]
+
+
+def test_large_values_are_digested():
+    """Test that heredocs, jsonencode(...) and long JSON strings become digests that expand on request."""
+    path = str(FIXTURES / "plan_blobs.txt")
+    changes = load_plan(path)
+    assert load_plan(path, use_mmap=True) == changes
+
+    user_data = changes[0].change.after["user_data"]
+    assert isinstance(user_data, BlobValue)
+    assert user_data.startswith("<heredoc ") and len(user_data) < 100
+    assert user_data.expand().startswith("#!/bin/bash\nexport SETTING_0")
+    # Lines inside the heredoc are not mistaken for attributes
+    assert "export" not in changes[0].change.after
+
+    policy = changes[1].change.after["policy"]
+    assert policy.endswith("keys: Statement, Version, 12 statements>")
+    assert "Action" not in changes[1].change.after
+
+    queue_policy = changes[2].change.after["policy"]
+    assert queue_policy.startswith("<string ") and queue_policy.endswith("20 statements>")
+    assert json.loads(queue_policy.expand())["Version"] == "2012-10-17"
+
+    # Small values are kept as they are, and changed jsonencode(...) values are still diffed
+    assert changes[3].change.deltas[0] == AttributeDelta(path="policy.Statement.Action", op="~", before="s3:GetObject", after="s3:*")
+
+
+def test_compressed_plans(tmp_path):
+    """Test that compressed plans are detected by their magic bytes and parsed like the plain file."""
+    for name in ("plan_large.txt", "plan_small.json"):
+        plain = (FIXTURES / name).read_bytes()
+        expected = [change.model_dump() for change in load_plan(str(FIXTURES / name))]
+        compressors = {"gzip": gzip.compress, "xz": lzma.compress}
+        # zstd is optional
+        try:
+            import zstandard
+            compressors["zstd"] = zstandard.ZstdCompressor().compress
+        except ImportError:
+            pass
+
+        for compression, compress in compressors.items():
+            data = compress(plain)
+            assert compression_format(data) == compression
+            path = tmp_path / f"{name}.{compression}"
+            path.write_bytes(data)
+            assert [change.model_dump() for change in load_plan(str(path), use_mmap=True)] == expected
+            assert count_plan_changes(str(path)).total == len(expected)
+            assert open_plan_payload(data).read() == plain.decode("utf-8")
+
+    assert compression_format(plain) is None
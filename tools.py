@@ -1,13 +1,178 @@
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
 import re
 import sys
-from typing import List
-from pydantic import BaseModel
+import textwrap
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+from multiprocessing import shared_memory
+from typing import Iterable, Iterator, List
+from pydantic import BaseModel, ConfigDict, Field, field_serializer
+
+
+class LazyAttributes(Mapping):
+    """
+    Read-only mapping over the attribute lines of one block in a plan buffer.
+
+    Only the block's offsets are stored; the attributes are decoded the first time
+    any key is accessed and memoized, after which the buffer is released.
+    """
+
+    __slots__ = ('buffer', 'start', 'end', '_attributes')
+
+    def __init__(self, buffer, start: int, end: int):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self._attributes = None
+
+    def _decoded(self) -> dict:
+        if self._attributes is None:
+            self._attributes = decode_attributes(self.buffer, self.start, self.end)
+            self.buffer = None
+        return self._attributes
+
+    def __getitem__(self, key):
+        return self._decoded()[key]
+
+    def __iter__(self):
+        return iter(self._decoded())
+
+    def __len__(self) -> int:
+        return len(self._decoded())
+
+    def __repr__(self) -> str:
+        return repr(self._decoded())
+
+
+class LazyDeltas(Sequence):
+    """
+    Read-only sequence of the deltas of an updated or replaced block.
+
+    Only an iterable over the block's body lines is stored, e.g. body_lines over the
+    plan buffer; the deltas are parsed the first time they are read and memoized,
+    after which the lines are released. Empty deltas are falsy, like None.
+    """
+
+    __slots__ = ('lines', '_deltas')
+
+    def __init__(self, lines: Iterable[str]):
+        self.lines = lines
+        self._deltas = None
+
+    def _parsed(self) -> list:
+        if self._deltas is None:
+            self._deltas = parse_deltas(self.lines)
+            self.lines = None
+        return self._deltas
+
+    def __getitem__(self, index):
+        return self._parsed()[index]
+
+    def __iter__(self):
+        return iter(self._parsed())
+
+    def __len__(self) -> int:
+        return len(self._parsed())
+
+    def __repr__(self) -> str:
+        return repr(self._parsed())
+
+    def __eq__(self, other):
+        # Equal to the same deltas parsed eagerly, and to None when there are none
+        if other is None:
+            return not self
+        if isinstance(other, (LazyDeltas, list, tuple)):
+            return self._parsed() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # The lines may be a generator over a mapping; pickle the parsed deltas
+        return list, (self._parsed(),)
+
+
+class BlobValue(str):
+    """
+    Digest standing in for a large attribute value: a heredoc, a jsonencode(...) call
+    or a long string.
+
+    It is a str holding the digest (kind, size, hash and, for JSON, its top-level
+    keys and statement count), so it can go into a prompt as is. Only the value's
+    offsets into the plan buffer are kept; expand() decodes the full value.
+    """
+
+    def __new__(cls, digest: str, kind: str, buffer, start: int, end: int):
+        value = super().__new__(cls, digest)
+        value.kind = kind
+        value.buffer = buffer
+        value.start = start
+        value.end = end
+        return value
+
+    def expand(self) -> str:
+        """Return the full value: a string unquoted, other values with the plan's indentation removed."""
+        text = text_slice(self.buffer, self.start, self.end)
+        if self.kind != 'string':
+            return textwrap.dedent(text)
+        text = text.strip()
+        try:
+            return json.loads(text)
+        except ValueError:
+            return clean_attribute_value(text)
+
+    def __reduce__(self):
+        # Pickled with the value itself, as the buffer may be a mapping
+        text = text_slice(self.buffer, self.start, self.end)
+        return BlobValue, (str(self), self.kind, text, 0, len(text))
+
+
+class AttributeDelta(BaseModel):
+    """
+    One change inside an updated or replaced resource.
+
+    op is "+" (added), "-" (removed), "~" (changed from before to after) or "#" for
+    a "(N unchanged ... hidden)" note, whose text is in after. path is dotted, e.g.
+    "tags.Name"; list elements are reported under the path of their list.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    path: str
+    op: str
+    # BlobValue first, so digests keep their expand()
+    before: BlobValue | str | None = Field(default=None, union_mode='left_to_right')
+    after: BlobValue | str | None = Field(default=None, union_mode='left_to_right')
+
+    @field_serializer('before', 'after')
+    def serialize_value(self, value):
+        return str(value) if value is not None else None
 
 
 class Change(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     actions: List[str]
     before: dict | None = None
-    after: dict | None = None
+    # Tried left to right so a LazyAttributes is kept as-is instead of being decoded into a dict
+    after: LazyAttributes | dict | None = Field(default=None, union_mode='left_to_right')
+    # Only filled in for updates and replacements; LazyDeltas first, so it isn't parsed on validation
+    deltas: LazyDeltas | List[AttributeDelta] | None = Field(default=None, union_mode='left_to_right')
+
+    @field_serializer('after')
+    def serialize_after(self, after):
+        return dict(after) if after is not None else None
+
+    @field_serializer('deltas')
+    def serialize_deltas(self, deltas):
+        # Blocks without any deltas are None, however they were parsed
+        return [delta.model_dump() for delta in deltas] or None if deltas is not None else None
 
 
 class ResourceChange(BaseModel):
@@ -18,149 +183,1087 @@ class ResourceChange(BaseModel):
     change: Change
 
 
+class PlanCount(BaseModel):
+    """
+    Change counts of a plan, taken without parsing its resources.
+
+    total is the number of changed resources, which is what the parser would return:
+    the block headers when they were counted, otherwise the summary line's sum with
+    replaced resources (an add and a destroy each to Terraform) counted once and
+    resources that are only imported added. to_replace and imported_only count
+    those headers.
+    """
+    total: int
+    to_import: int | None = None
+    to_add: int | None = None
+    to_change: int | None = None
+    to_destroy: int | None = None
+    headers: int | None = None
+    to_replace: int | None = None
+    imported_only: int | None = None
+    mismatch: bool = False
+
+
+# Block header, e.g. "  # aws_instance.web will be created". Matched against a
+# whole line, which must be preceded and followed by a newline.
+HEADER_RE = re.compile(r'  # (.+?) will be (.+)')
+# Looser header match used only when a plan has no properly indented headers
+FALLBACK_HEADER_RE = re.compile(r'# (.+?) will be (.+)')
+
+# Whole-buffer equivalents, run over plan text (str) or raw bytes such as an mmap.
+# A block header must sit between two newlines; the looser header alternative
+# does not consume its newline, so it can never swallow the one a block header
+# needs. Whitespace classes exclude newlines so attribute matches stay on one line.
+BLOCK_PATTERN = r'\n  # (.+?) will be (.+?)\n|# (.+?) will be (.+?)$'
+ATTRIBUTE_PATTERN = r'^[ \t\r\f\v]*[+~-]?[ \t\r\f\v]*(\w+)[ \t\r\f\v]*=[ \t\r\f\v]*(.+)'
+BLOCK_RE_TEXT = re.compile(BLOCK_PATTERN, re.MULTILINE)
+BLOCK_RE_BYTES = re.compile(BLOCK_PATTERN.encode(), re.MULTILINE)
+ATTRIBUTE_RE_TEXT = re.compile(ATTRIBUTE_PATTERN, re.MULTILINE)
+ATTRIBUTE_RE_BYTES = re.compile(ATTRIBUTE_PATTERN.encode(), re.MULTILINE)
+# First attribute line whose value would actually be recorded: non-empty and
+# not "(known after apply)"
+VALUE_PATTERN = r'^[ \t\r\f\v]*[+~-]?[ \t\r\f\v]*\w+[ \t\r\f\v]*=[ \t\r\f\v]*(?!\(known after apply\)[ \t\r\f\v]*$)\S'
+VALUE_RE_TEXT = re.compile(VALUE_PATTERN, re.MULTILINE)
+VALUE_RE_BYTES = re.compile(VALUE_PATTERN.encode(), re.MULTILINE)
+# Block headers alone, used to cut a plan into chunks that start on a block boundary
+BLOCK_HEADER_RE_BYTES = re.compile(rb'\n  # .+? will be .+?\n')
+
+# One "module.name" step of an address, with its count/for_each key if any, and the dot after it
+MODULE_CALL_RE = re.compile(r'module\.([\w-]+)(\[(?:"(?:[^"\\]|\\.)*"|\d+)\])?\.')
+
+# Line inside a block, split into its change marker ("-/+" and "+/-" mark replaced nested blocks) and the rest
+DELTA_LINE_RE = re.compile(r'(?:(-/\+|\+/-|[+~-]) +)?(.*)')
+# "key = value", with map keys possibly quoted
+DELTA_ATTRIBUTE_RE = re.compile(r'("(?:[^"\\]|\\.)*"|[\w-]+) *= *(.*)')
+# Nested block opener, e.g. "ingress {" or "resource \"aws_instance\" \"web\" {"
+DELTA_BLOCK_RE = re.compile(r'([\w-]+)(?: +"[^"]*")* *\{')
+# "# (3 unchanged elements hidden)" and the like
+HIDDEN_RE = re.compile(r'# \((.+ hidden)\)')
+FORCES_REPLACEMENT_SUFFIX = ' # forces replacement'
+HEREDOC_RE = re.compile(r'<<-?(\w+)$')
+# Values longer than this many characters are replaced by a BlobValue digest
+BLOB_DIGEST_SIZE = 1024
+# Top-level key of a multi-line value, e.g. "+ Statement = ["
+BLOB_KEY_RE = re.compile(r'"?([\w-]+)"? *=')
+# Actions whose blocks are worth diffing; created and destroyed blocks are all additions or removals
+DELTA_ACTIONS = ('update', 'replace')
+
+# Plans are cut into chunks of roughly this many bytes for parallel parsing
+PARALLEL_CHUNK_SIZE = 4 * 1024 * 1024
+
+# JSON plans are read this many characters at a time
+JSON_CHUNK_SIZE = 64 * 1024
+# Characters that change the JSON nesting state, outside and inside strings
+JSON_STRUCTURE_RE = re.compile(r'["{}\[\]]')
+JSON_STRING_END_RE = re.compile(r'["\\]')
+
+# Compressed plans are recognized by these leading bytes
+COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'xz': b'\xfd7zXZ\x00',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+COMPRESSION_MAGIC_SIZE = max(len(magic) for magic in COMPRESSION_MAGIC.values())
+
+# Terraform's trailing summary line, e.g. "Plan: 10 to add, 1 to change, 0 to destroy."
+SUMMARY_PATTERN = r'Plan: (?:(\d+) to import, )?(\d+) to add, (\d+) to change, (\d+) to destroy'
+SUMMARY_RE_TEXT = re.compile(SUMMARY_PATTERN)
+SUMMARY_RE_BYTES = re.compile(SUMMARY_PATTERN.encode())
+
+
+def text_slice(buffer, start: int, end: int) -> str:
+    """Return buffer[start:end] as str, decoding it if the buffer holds bytes."""
+    value = buffer[start:end]
+    return value if isinstance(value, str) else str(value, 'utf-8', 'replace')
+
+
+def parse_action(action_description: str) -> List[str]:
+    """Map the tail of a block header ("created", "updated in-place", ...) to actions."""
+    if 'created' in action_description:
+        return ['create']
+    elif 'updated' in action_description:
+        return ['update']
+    elif 'destroyed' in action_description:
+        return ['delete']
+    elif 'replaced' in action_description:
+        return ['replace']
+    return ['unknown']
+
+
+def split_module_path(full_address: str) -> tuple[str, str]:
+    """
+    Split a resource address into its module path and the resource within it, e.g.
+    'module.a["x.y"].module.b.aws_vpc.main' into ('module.a["x.y"].module.b', 'aws_vpc.main').
+    count and for_each keys stay on their module call; dots inside keys are not separators.
+    """
+    pos = 0
+    while True:
+        call = MODULE_CALL_RE.match(full_address, pos)
+        if call is None:
+            break
+        pos = call.end()
+    # A module call must be followed by a resource
+    if pos == 0 or '.' not in full_address[pos:]:
+        return '', full_address
+    return full_address[:pos - 1], full_address[pos:]
+
+
+def split_address(full_address: str) -> tuple[str, str]:
+    """Split a resource address into its (type, name) pair, whatever module it sits in."""
+    resource = split_module_path(full_address)[1]
+    if '.' not in resource:
+        return 'unknown', full_address
+    # resource_type.resource_name, where the name may carry an index key
+    resource_type, resource_name = resource.split('.', 1)
+    return resource_type, resource_name
+
+
+def clean_attribute_value(value: str) -> str | None:
+    """Remove quotes from an attribute value; None for values only known after apply."""
+    if value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    elif value == '(known after apply)':
+        return None
+    return value
+
+
+def opens_blob(value: str) -> bool:
+    """Tell whether an attribute value continues on the following lines as a heredoc or a (...) call."""
+    return value.endswith('(') or ('<<' in value and HEREDOC_RE.search(value) is not None)
+
+
+class BlobScanner:
+    """
+    Follows the lines of a heredoc or multi-line (...) value until the one closing it,
+    noting the top-level keys and IAM statements seen on the way.
+    """
+
+    def __init__(self, opener: str):
+        heredoc = HEREDOC_RE.search(opener)
+        self.lines = []  # filled in by callers that parse line by line
+        self.terminator = heredoc.group(1) if heredoc else None
+        self.kind = 'heredoc' if heredoc else 'jsonencode'
+        self.depth = 1
+        self.keys = []
+        self.statements = 0
+        self._in_statement = False
+
+    def closes(self, line: str) -> bool:
+        """Feed the next line; True if it closes the value (and so is not part of it)."""
+        text = line.strip()
+        if self.terminator is not None:
+            return text == self.terminator
+
+        body = DELTA_LINE_RE.fullmatch(text).group(2)
+        if body[:1] in ')]}':
+            self.depth -= 1
+            if self.depth == 0:
+                return True
+        # Keys sit right inside the top-level {...}, statements right inside its Statement list
+        if self.depth == 2:
+            key = BLOB_KEY_RE.match(body)
+            if key:
+                self.keys.append(key.group(1))
+                self._in_statement = key.group(1) == 'Statement'
+        elif self.depth == 3 and self._in_statement and body in ('{', '{,'):
+            self.statements += 1
+        if body.endswith(('(', '[', '{')):
+            self.depth += 1
+        return False
+
+
+def blob_value(kind: str, buffer, start: int, end: int, keys: List[str] | None = None,
+               statements: int = 0) -> str:
+    """
+    Return buffer[start:end] as an attribute value, or a BlobValue digest of it if it
+    is longer than BLOB_DIGEST_SIZE. Heredocs and strings holding JSON are summarized
+    by their top-level keys.
+    """
+    if end - start <= BLOB_DIGEST_SIZE:
+        return textwrap.dedent(text_slice(buffer, start, end))
+
+    data = buffer[start:end]
+    data = data.encode('utf-8') if isinstance(data, str) else bytes(data)
+    if keys is None:
+        keys = []
+        try:
+            document = json.loads(data)
+            if kind == 'string' and isinstance(document, str):
+                document = json.loads(document)
+        except ValueError:
+            document = None
+        if isinstance(document, dict):
+            keys = list(document)
+            if isinstance(document.get('Statement'), list):
+                statements = len(document['Statement'])
+
+    digest = f'<{kind} {len(data)} bytes sha256:{hashlib.sha256(data).hexdigest()[:12]}'
+    if keys:
+        digest += f" keys: {', '.join(keys)}"
+    if statements:
+        digest += f", {statements} statement{'' if statements == 1 else 's'}"
+    return BlobValue(digest + '>', kind, buffer, start, end)
+
+
+def _skip_blob(buffer, scanner: BlobScanner, pos: int, end: int) -> tuple[int, int]:
+    """Feed the lines from pos to a BlobScanner; return where its value ends and where the closing line ends."""
+    newline = '\n' if isinstance(buffer, str) else b'\n'
+    if scanner.terminator is not None:
+        # Nothing inside a heredoc is noted, so search for its terminator line directly
+        pattern = rf'^[ \t\r\f\v]*{scanner.terminator}[ \t\r\f\v]*$'
+        pattern = re.compile(pattern if isinstance(buffer, str) else pattern.encode(), re.MULTILINE)
+        closing = pattern.search(buffer, pos, end)
+        if closing is None:
+            return end, end
+        line_end = buffer.find(newline, closing.end(), end)
+        return closing.start(), end if line_end == -1 else line_end + 1
+    # Split the rest of the block at once rather than finding and slicing line by line
+    for line in buffer[pos:end].split(newline):
+        line_end = min(pos + len(line) + 1, end)
+        if scanner.closes(line if isinstance(line, str) else str(line, 'utf-8', 'replace')):
+            return pos, line_end
+        pos = line_end
+    return end, end
+
+
+def _attribute_matches(buffer, start: int, end: int) -> Iterator[tuple[str, str]]:
+    """Yield (key, cleaned value) for each attribute line in buffer[start:end]."""
+    pattern = ATTRIBUTE_RE_TEXT if isinstance(buffer, str) else ATTRIBUTE_RE_BYTES
+    pos = start
+    while True:
+        config_match = pattern.search(buffer, pos, end)
+        if config_match is None:
+            return
+        pos = config_match.end()
+        raw_value = config_match.group(2).strip()
+        # Trailing whitespace alone is not a value
+        if not raw_value:
+            continue
+        if not isinstance(raw_value, str):
+            raw_value = raw_value.decode('utf-8', 'replace')
+        key = config_match.group(1)
+        key = key if isinstance(key, str) else key.decode('ascii')
+
+        if opens_blob(raw_value):
+            # The value's own lines are not attributes; resume after its closing line
+            scanner = BlobScanner(raw_value)
+            blob_start = min(pos + 1, end)
+            blob_end, pos = _skip_blob(buffer, scanner, blob_start, end)
+            keys = scanner.keys if scanner.kind == 'jsonencode' else None
+            yield key, blob_value(scanner.kind, buffer, blob_start, blob_end, keys, scanner.statements)
+            continue
+
+        value = clean_attribute_value(raw_value)
+        if value is not None:
+            if len(value) > BLOB_DIGEST_SIZE:
+                value = blob_value('string', buffer, config_match.start(2), config_match.end(2))
+            yield key, value
+
+
+def _delta_value(value: str) -> str:
+    value = value.strip()
+    if value.endswith(','):
+        value = value[:-1]
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    return value
+
+
+def _delta(path: str, op: str, value: str) -> AttributeDelta:
+    if op == '+':
+        return AttributeDelta(path=path, op=op, after=_delta_value(value))
+    before, arrow, after = value.partition(' -> ')
+    if op == '-':
+        # Removed values are shown as "value -> null"
+        return AttributeDelta(path=path, op=op, before=_delta_value(before))
+    if not arrow:
+        return AttributeDelta(path=path, op=op, after=_delta_value(value))
+    return AttributeDelta(path=path, op=op, before=_delta_value(before), after=_delta_value(after))
+
+
+def parse_deltas(lines: Iterable[str]) -> List[AttributeDelta]:
+    """
+    Parse the body of an updated or replaced block into structured deltas.
+
+    Nested lists, maps, blocks and jsonencode(...) calls are followed so that, e.g.,
+    an element added to `~ members = [` is reported as an addition to "members".
+    Unmarked lines are unchanged context and produce nothing. Heredoc values, and
+    jsonencode(...) values added or removed as a whole, are kept as one value, which
+    becomes a BlobValue digest when large.
+    """
+    deltas = []
+    paths = []  # path of each open container; the resource block itself is ""
+    blob = None  # (BlobScanner, path, op) of a multi-line value being read whole
+    for line in lines:
+        text = line.strip()
+        if blob:
+            scanner, path, op = blob
+            if not scanner.closes(line):
+                scanner.lines.append(line.rstrip('\r\n'))
+                continue
+            value = '\n'.join(scanner.lines)
+            value = blob_value(scanner.kind, value, 0, len(value),
+                               scanner.keys if scanner.kind == 'jsonencode' else None, scanner.statements)
+            if op == '-':
+                deltas.append(AttributeDelta(path=path, op=op, before=value))
+            elif op:
+                deltas.append(AttributeDelta(path=path, op=op, after=value))
+            blob = None
+            continue
+        if not text:
+            continue
+
+        op, body = DELTA_LINE_RE.fullmatch(text).groups()
+        if op and len(op) == 3:
+            op = '~'
+        if body.endswith(FORCES_REPLACEMENT_SUFFIX):
+            body = body[:-len(FORCES_REPLACEMENT_SUFFIX)]
+
+        if not paths:
+            # Nothing counts until the resource block's own opener
+            if DELTA_BLOCK_RE.fullmatch(body):
+                paths.append('')
+            continue
+        parent = paths[-1]
+
+        hidden = HIDDEN_RE.fullmatch(body)
+        if hidden:
+            deltas.append(AttributeDelta(path=parent, op='#', after=hidden.group(1)))
+            continue
+        if body[0] in '}])':
+            paths.pop()
+            if not paths:
+                break
+            continue
+
+        attribute = DELTA_ATTRIBUTE_RE.fullmatch(body)
+        if attribute:
+            key = attribute.group(1).strip('"')
+            path = f'{parent}.{key}' if parent else key
+            value = attribute.group(2)
+        else:
+            block = DELTA_BLOCK_RE.fullmatch(body)
+            if block:
+                paths.append(f'{parent}.{block.group(1)}' if parent else block.group(1))
+                continue
+            # A list element
+            path, value = parent, body
+
+        # Heredocs, and jsonencode(...) values added or removed as a whole, are kept as
+        # one value; changed jsonencode(...) values are followed like maps
+        if opens_blob(value) and (op in ('+', '-') or not value.endswith('(')):
+            blob = (BlobScanner(value), path, op)
+            continue
+        if value.endswith(('[', '{', '(')):
+            paths.append(path)
+            continue
+        if op:
+            deltas.append(_delta(path, op, value))
+    return deltas
+
+
+def _json_delta_value(value) -> str:
+    return value if isinstance(value, str) else json.dumps(value, separators=(',', ':'))
+
+
+def json_deltas(before, after, unknown=None, path: str = '') -> List[AttributeDelta]:
+    """
+    Diff the before and after values of a JSON plan entry into the deltas the text
+    parser reports: maps are followed key by key, lists report the elements added
+    and removed, and values listed in after_unknown become "(known after apply)".
+    """
+    if unknown is True:
+        return [AttributeDelta(path=path, op='~', before=_json_delta_value(before), after='(known after apply)')]
+    if isinstance(before, dict) and isinstance(after, dict):
+        unknown = unknown if isinstance(unknown, dict) else {}
+        deltas = []
+        for key in chain(after, (key for key in before if key not in after)):
+            key_path = f'{path}.{key}' if path else key
+            if key not in before:
+                deltas.append(AttributeDelta(path=key_path, op='+', after=_json_delta_value(after[key])))
+            elif key not in after:
+                if unknown.get(key) is True:
+                    deltas.extend(json_deltas(before[key], None, True, key_path))
+                else:
+                    deltas.append(AttributeDelta(path=key_path, op='-', before=_json_delta_value(before[key])))
+            elif before[key] != after[key] or key in unknown:
+                deltas.extend(json_deltas(before[key], after[key], unknown.get(key), key_path))
+        return deltas
+    if before == after:
+        return []
+    if isinstance(before, list) and isinstance(after, list):
+        removed = [AttributeDelta(path=path, op='-', before=_json_delta_value(item)) for item in before if item not in after]
+        added = [AttributeDelta(path=path, op='+', after=_json_delta_value(item)) for item in after if item not in before]
+        if removed or added:
+            return removed + added
+    return [AttributeDelta(path=path, op='~', before=_json_delta_value(before), after=_json_delta_value(after))]
+
+
+def decode_attributes(buffer, start: int, end: int) -> dict:
+    """Decode the attribute lines of a block held in buffer[start:end]."""
+    return dict(_attribute_matches(buffer, start, end))
+
+
+def lazy_attributes(buffer, start: int, end: int) -> LazyAttributes | None:
+    """
+    Return a LazyAttributes over buffer[start:end], or None if the block has no attributes.
+
+    Deciding between the two is a single regex search, without decoding anything.
+    """
+    pattern = VALUE_RE_TEXT if isinstance(buffer, str) else VALUE_RE_BYTES
+    if pattern.search(buffer, start, end):
+        return LazyAttributes(buffer, start, end)
+    return None
+
+
+def body_lines(buffer, start: int, end: int) -> Iterator[str]:
+    """Lazily yield the lines of buffer[start:end]; nothing is decoded unless iterated."""
+    yield from text_slice(buffer, start, end).splitlines()
+
+
+def build_resource_change(full_address: str, action_description: str, after_config: Mapping | None = None,
+                          body: Iterable[str] | None = None) -> ResourceChange:
+    """
+    Assemble a ResourceChange from a parsed block header and its attributes.
+
+    The lines of the block body are only kept for updates and replacements, whose
+    deltas are parsed from them when first read (LazyDeltas).
+    """
+    full_address = full_address.strip()
+    resource_type, resource_name = split_address(full_address)
+    actions = parse_action(action_description.strip())
+    deltas = None
+    if body is not None and actions[0] in DELTA_ACTIONS:
+        deltas = LazyDeltas(body)
+    change = Change(actions=actions, after=after_config, deltas=deltas)
+    return ResourceChange(
+        address=full_address,
+        mode='managed',
+        type=resource_type,
+        name=resource_name,
+        change=change
+    )
+
+
+def iter_resource_changes(stream: Iterable[str]) -> Iterator[ResourceChange]:
+    """
+    Parse text plan output line by line, yielding each ResourceChange as soon as its block closes.
+
+    The stream is read exactly once. Lines are only checked for block headers; each
+    block's lines are joined into one string when it closes, and its attributes and
+    deltas are decoded lazily from that string, as for plans held in a buffer. Plans
+    without any indented "  # ... will be ..." headers fall back to the looser header
+    match; only those (small) header matches are held back until EOF, never the plan
+    text itself.
+    """
+    header = None  # match of the open block's header
+    lines = []  # the open block's body lines
+    fallback = []
+    seen_block = False
+    # A header needs a newline before it, and that newline can't be the one
+    # terminating the previous header
+    previous_was_header = True
+
+    for line in stream:
+        if previous_was_header:
+            previous_was_header = False
+        elif line.startswith('  # ') and line.endswith('\n') and ' will be ' in line:
+            match = HEADER_RE.fullmatch(line.rstrip('\n'))
+            if match:
+                if header:
+                    yield _block_resource_change(header, lines)
+                header = match
+                lines = []
+                seen_block = previous_was_header = True
+                fallback = []
+                continue
+        if header:
+            lines.append(line)
+        elif not seen_block:
+            fallback_match = FALLBACK_HEADER_RE.search(line)
+            if fallback_match:
+                fallback.append((fallback_match.group(1), fallback_match.group(2)))
+
+    if header:
+        yield _block_resource_change(header, lines)
+    elif not seen_block:
+        # Fallback to simpler parsing: headers only, no configuration details
+        for full_address, action_description in fallback:
+            yield build_resource_change(full_address, action_description)
+
+
+def _block_resource_change(header: re.Match, lines: List[str]) -> ResourceChange:
+    body = ''.join(lines)
+    # Lines for deltas are only needed, and only read from the body, for updates and replacements
+    lines = body_lines(body, 0, len(body)) if parse_action(header.group(2).strip())[0] in DELTA_ACTIONS else None
+    return build_resource_change(header.group(1), header.group(2), lazy_attributes(body, 0, len(body)), lines)
+
+
+def scan_blocks(buffer, start: int = 0, end: int | None = None, fallback: bool = True) -> Iterator[tuple[int, int, int, int, int, int]]:
+    """
+    Scan plan output held in a buffer (str, bytes, mmap or memoryview) in a single pass.
+
+    Yields (address start, address end, action start, action end, body start, body end)
+    offsets for each block in buffer[start:end]. Plans without indented headers fall
+    back to the looser header match, whose blocks have an empty body; only those
+    header offsets are held back until the end of the scan.
+    """
+    if end is None:
+        end = len(buffer)
+    pattern = BLOCK_RE_TEXT if isinstance(buffer, str) else BLOCK_RE_BYTES
+    header = None
+    fallback_spans = []
+    for match in pattern.finditer(buffer, start, end):
+        if match.start(1) == -1:
+            if fallback and header is None:
+                fallback_spans.append(match.span(3) + match.span(4))
+            continue
+        if header:
+            yield header.span(1) + header.span(2) + (header.end(), match.start())
+        header = match
+
+    if header:
+        yield header.span(1) + header.span(2) + (header.end(), end)
+        return
+
+    for spans in fallback_spans:
+        yield spans + (spans[3], spans[3])
+
+
+def resource_changes_from_spans(buffer, blocks: Iterable[tuple[int, int, int, int, int, int]]) -> Iterator[ResourceChange]:
+    """Build ResourceChanges from scan_blocks offsets, with attributes decoded lazily."""
+    for address_start, address_end, action_start, action_end, body_start, body_end in blocks:
+        yield build_resource_change(
+            text_slice(buffer, address_start, address_end),
+            text_slice(buffer, action_start, action_end),
+            lazy_attributes(buffer, body_start, body_end),
+            body_lines(buffer, body_start, body_end)
+        )
+
+
+def iter_resource_changes_buffer(buffer) -> Iterator[ResourceChange]:
+    """
+    Parse plan output held in a buffer: plan text, or raw bytes such as an mmap of the plan file.
+
+    Block headers are found by scanning the buffer; only addresses and actions are
+    decoded up front, and each block's attributes are decoded lazily from its offsets.
+    """
+    return resource_changes_from_spans(buffer, scan_blocks(buffer))
+
+
+def chunk_boundaries(buffer, chunk_size: int = PARALLEL_CHUNK_SIZE) -> List[int]:
+    """
+    Return offsets cutting buffer into chunks of about chunk_size bytes.
+
+    Every offset but the first is the newline that opens a block header, so each
+    chunk can be scanned on its own. The last offset is len(buffer).
+    """
+    boundaries = [0]
+    target = chunk_size
+    while target < len(buffer):
+        header = BLOCK_HEADER_RE_BYTES.search(buffer, target)
+        if header is None:
+            break
+        boundaries.append(header.start())
+        target = header.start() + chunk_size
+    boundaries.append(len(buffer))
+    return boundaries
+
+
+def _scan_chunk(source: tuple[str, str], start: int, end: int) -> list:
+    """
+    Worker: scan one chunk of a plan shared through a file mapping or shared memory.
+
+    Returns (address, action description, body start, body end, has attributes)
+    per block, so the parent only has to assemble the models.
+    """
+    kind, name = source
+    if kind == 'shm':
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            return _describe_blocks(shm.buf, start, end)
+        finally:
+            shm.close()
+
+    with open(name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return _describe_blocks(buffer, start, end)
+
+
+def _describe_blocks(buffer, start: int, end: int) -> list:
+    blocks = []
+    for address_start, address_end, action_start, action_end, body_start, body_end in scan_blocks(buffer, start, end, fallback=False):
+        blocks.append((
+            text_slice(buffer, address_start, address_end),
+            text_slice(buffer, action_start, action_end),
+            body_start,
+            body_end,
+            VALUE_RE_BYTES.search(buffer, body_start, body_end) is not None
+        ))
+    return blocks
+
+
+def _parse_parallel(source: tuple[str, str], buffer, workers: int | None, chunk_size: int) -> List[ResourceChange]:
+    """
+    Parse buffer in header-aligned chunks across a process pool, keeping block order.
+
+    Workers reach the plan through source (a file path or shared memory name), so
+    only chunk offsets and small per-block records cross process boundaries.
+    Attributes are left to be decoded lazily from buffer.
+    """
+    boundaries = chunk_boundaries(buffer, chunk_size)
+    if len(boundaries) <= 2:
+        return list(iter_resource_changes_buffer(buffer))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(_scan_chunk, repeat(source), boundaries[:-1], boundaries[1:]))
+
+    resource_changes = []
+    for chunk in chunks:
+        for address, action_description, body_start, body_end, has_attributes in chunk:
+            after = LazyAttributes(buffer, body_start, body_end) if has_attributes else None
+            resource_changes.append(build_resource_change(
+                address, action_description, after, body_lines(buffer, body_start, body_end)
+            ))
+
+    # No indented headers anywhere: the looser fallback match needs the whole plan
+    return resource_changes or list(iter_resource_changes_buffer(buffer))
+
+
+def parse_plan_parallel(path: str, workers: int | None = None, chunk_size: int = PARALLEL_CHUNK_SIZE) -> List[ResourceChange]:
+    """Parse a plan file across a pool of worker processes, each mapping the file itself."""
+    with open(path, 'rb') as f:
+        # Empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        # Left open for the lazily decoded attributes, as in load_plan
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _parse_parallel(('file', path), buffer, workers, chunk_size)
+
+
+def parse_terraform_plan_text_parallel(plan_text: str, workers: int | None = None,
+                                       chunk_size: int = PARALLEL_CHUNK_SIZE) -> List[ResourceChange]:
+    """Parse plan text across a pool of worker processes that read it from shared memory."""
+    if len(plan_text) <= chunk_size:
+        return parse_terraform_plan_text(plan_text)
+
+    data = plan_text.encode('utf-8')
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        shm.buf[:len(data)] = data
+        # The parent decodes attributes from its own copy, so the segment can go right after
+        return _parse_parallel(('shm', shm.name), data, workers, chunk_size)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
 def parse_terraform_plan_text(plan_text: str) -> List[ResourceChange]:
     """Parse text-based Terraform plan output and extract resource changes."""
-    resource_changes = []
-    
-    # Find all resource blocks in the plan with their configuration
-    # Look for patterns like: # resource_type.resource_name will be created
-    # followed by resource configuration block
-    
-    # Split by resource blocks
-    resource_blocks = re.split(r'\n  # (.+?) will be (.+?)\n', plan_text)
-    
-    # Process each resource block
-    for i in range(1, len(resource_blocks), 3):  # Skip first element, then take every 3rd
-        if i + 2 < len(resource_blocks):
-            full_address = resource_blocks[i].strip()
-            action_description = resource_blocks[i + 1].strip()
-            config_block = resource_blocks[i + 2] if i + 2 < len(resource_blocks) else ""
-            
-            # Parse the action
-            actions = []
-            if 'created' in action_description or 'be created' in action_description:
-                actions = ['create']
-            elif 'updated' in action_description or 'be updated' in action_description:
-                actions = ['update'] 
-            elif 'destroyed' in action_description or 'be destroyed' in action_description:
-                actions = ['delete']
-            elif 'replaced' in action_description or 'be replaced' in action_description:
-                actions = ['replace']
-            else:
-                actions = ['unknown']
-            
-            # Extract resource type and name from address
-            if '.' in full_address:
-                parts = full_address.split('.')
-                if len(parts) >= 2:
-                    # For module.name.resource_type.resource_name
-                    if parts[0] == 'module' and len(parts) >= 4:
-                        resource_type = parts[2]
-                        resource_name = '.'.join(parts[3:])
-                    # For resource_type.resource_name
-                    else:
-                        resource_type = parts[0]
-                        resource_name = '.'.join(parts[1:])
-                else:
-                    resource_type = 'unknown'
-                    resource_name = full_address
-            else:
-                resource_type = 'unknown'
-                resource_name = full_address
-            
-            # Parse configuration details from the config block
-            after_config = {}
-            if config_block:
-                # Extract key-value pairs from the resource block
-                config_lines = config_block.split('\n')
-                for line in config_lines:
-                    line = line.strip()
-                    # Look for lines like: + name = "value"
-                    config_match = re.match(r'[+~-]?\s*(\w+)\s*=\s*(.+)', line)
-                    if config_match:
-                        key = config_match.group(1)
-                        value = config_match.group(2).strip()
-                        # Clean up the value (remove quotes, handle known after apply)
-                        if value.startswith('"') and value.endswith('"'):
-                            value = value[1:-1]  # Remove quotes
-                        elif value == '(known after apply)':
-                            continue  # Skip these
-                        
-                        after_config[key] = value
-            
-            change = Change(actions=actions, after=after_config if after_config else None)
-            
-            resource_change = ResourceChange(
-                address=full_address,
-                mode='managed',
-                type=resource_type,
-                name=resource_name,
-                change=change
-            )
-            
-            resource_changes.append(resource_change)
-    
-    # Fallback to simpler parsing if the above doesn't work
-    if not resource_changes:
-        resource_pattern = r'# (.+?) will be (.+?)(?:\n|$)'
-        
-        for match in re.finditer(resource_pattern, plan_text, re.MULTILINE):
-            full_address = match.group(1).strip()
-            action_description = match.group(2).strip()
-            
-            # Parse the action
-            actions = []
-            if 'created' in action_description or 'be created' in action_description:
-                actions = ['create']
-            elif 'updated' in action_description or 'be updated' in action_description:
-                actions = ['update'] 
-            elif 'destroyed' in action_description or 'be destroyed' in action_description:
-                actions = ['delete']
-            elif 'replaced' in action_description or 'be replaced' in action_description:
-                actions = ['replace']
-            else:
-                actions = ['unknown']
-            
-            # Extract resource type and name from address
-            if '.' in full_address:
-                parts = full_address.split('.')
-                if len(parts) >= 2:
-                    if parts[0] == 'module' and len(parts) >= 4:
-                        resource_type = parts[2]
-                        resource_name = '.'.join(parts[3:])
-                    else:
-                        resource_type = parts[0]
-                        resource_name = '.'.join(parts[1:])
+    return list(iter_resource_changes_buffer(plan_text))
+
+
+def is_json_plan(head: str) -> bool:
+    """Tell `terraform show -json` output apart from text plan output by its first characters."""
+    return head.lstrip().startswith('{')
+
+
+def summarize_actions(actions: List[str]) -> str:
+    """Collapse a JSON plan actions list into the single action the text parser would report."""
+    if not actions:
+        return 'no-op'
+    if sorted(actions) == ['create', 'delete']:
+        return 'replace'
+    return actions[0]
+
+
+def iter_json_array(chunks: Iterable[str], key: str) -> Iterator:
+    """
+    Incrementally decode the elements of the top-level array `key` of a JSON document.
+
+    chunks is any iterable of text pieces (e.g. successive file reads). Only one
+    element at a time is held and passed to json.loads; every other top-level value
+    is skipped by tracking nesting and strings, without being decoded. Reading stops
+    as soon as the array closes.
+    """
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    depth = 0
+    in_string = False
+    in_array = False
+    key_start = None      # start of a string directly inside the top-level object
+    last_key = None
+    element_start = None  # start of the array element being collected
+    pending = []          # earlier pieces of that element, from previous chunks
+
+    while True:
+        if in_string:
+            match = JSON_STRING_END_RE.search(buf, pos)
+            if match and match.group() == '\\' and match.end() < len(buf):
+                # Skip the escaped character
+                pos = match.end() + 1
+                continue
+            if match and match.group() == '"':
+                in_string = False
+                pos = match.end()
+                if key_start is not None:
+                    last_key = buf[key_start + 1:match.start()]
+                    key_start = None
+                continue
+            # String (or an escape sequence) continues in the next chunk
+            pos = match.start() if match else len(buf)
+        else:
+            match = JSON_STRUCTURE_RE.search(buf, pos)
+            if match:
+                char = match.group()
+                pos = match.end()
+                if char == '"':
+                    in_string = True
+                    if depth == 1:
+                        key_start = match.start()
+                elif char in '{[':
+                    if in_array and depth == 2:
+                        element_start = match.start()
+                    elif depth == 1 and char == '[' and last_key == key:
+                        in_array = True
+                    depth += 1
                 else:
-                    resource_type = 'unknown'
-                    resource_name = full_address
-            else:
-                resource_type = 'unknown'
-                resource_name = full_address
-            
-            change = Change(actions=actions)
-            
-            resource_change = ResourceChange(
-                address=full_address,
-                mode='managed',
-                type=resource_type,
-                name=resource_name,
-                change=change
-            )
-            
-            resource_changes.append(resource_change)
-    
-    return resource_changes
-
-
-def load_plan(path: str) -> List[ResourceChange]:
-    """Load Terraform plan from text file or stdin and return list of resource changes."""
+                    depth -= 1
+                    if in_array and depth == 2:
+                        yield json.loads(''.join(pending) + buf[element_start:pos])
+                        element_start = None
+                        pending = []
+                    elif in_array and depth == 1:
+                        return
+                continue
+            pos = len(buf)
+
+        # Need more input; keep only what is still being collected
+        if element_start is not None:
+            pending.append(buf[element_start:pos])
+            buf, pos, element_start = buf[pos:], 0, 0
+        elif key_start is not None:
+            buf, pos, key_start = buf[key_start:], pos - key_start, 0
+        else:
+            buf, pos = buf[pos:], 0
+
+        chunk = next(chunks, '')
+        if not chunk:
+            if in_array:
+                raise ValueError(f'JSON plan ended inside "{key}"')
+            return
+        buf += chunk
+
+
+def digest_long_strings(values: dict | None) -> dict | None:
+    """Replace the long top-level string values of a JSON plan's before/after with BlobValue digests."""
+    if not values:
+        return values
+    digested = {}
+    for key, value in values.items():
+        if isinstance(value, str) and len(value) > BLOB_DIGEST_SIZE:
+            encoded = json.dumps(value)
+            value = blob_value('string', encoded, 0, len(encoded))
+        digested[key] = value
+    return digested
+
+
+def json_resource_change(entry: dict) -> ResourceChange | None:
+    """Build a ResourceChange from one `resource_changes` entry; None for no-op entries."""
+    change = entry.get('change') or {}
+    actions = change.get('actions') or []
+    # Unchanged resources are listed in JSON plans but never in text plans
+    if actions == ['no-op']:
+        return None
+    before, after = digest_long_strings(change.get('before')), digest_long_strings(change.get('after'))
+    deltas = None
+    if summarize_actions(actions) in DELTA_ACTIONS:
+        deltas = json_deltas(before, after, change.get('after_unknown')) or None
+    return ResourceChange(
+        address=entry['address'],
+        mode=entry.get('mode', 'managed'),
+        type=entry['type'],
+        name=entry['name'],
+        change=Change(actions=actions, before=before, after=after, deltas=deltas)
+    )
+
+
+def iter_resource_changes_json(chunks: Iterable[str]) -> Iterator[ResourceChange]:
+    """Stream resource changes out of `terraform show -json` output delivered in text chunks."""
+    for entry in iter_json_array(chunks, 'resource_changes'):
+        resource_change = json_resource_change(entry)
+        if resource_change is not None:
+            yield resource_change
+
+
+def text_chunks(text: str, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[str]:
+    """Cut text into pieces for the chunk-based JSON reader."""
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+def stream_chunks(stream, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[str]:
+    """Read a text stream in pieces for the chunk-based JSON reader."""
+    return iter(lambda: stream.read(chunk_size), '')
+
+
+def parse_terraform_plan_json(plan_json: str) -> List[ResourceChange]:
+    """Parse `terraform show -json` output held in a string, without decoding the whole document."""
+    return list(iter_resource_changes_json(text_chunks(plan_json)))
+
+
+def parse_plan(plan_text: str) -> List[ResourceChange]:
+    """Parse plan output in either text or `terraform show -json` format."""
+    if is_json_plan(plan_text[:JSON_CHUNK_SIZE]):
+        return parse_terraform_plan_json(plan_text)
+    return parse_terraform_plan_text(plan_text)
+
+
+def compression_format(head: bytes) -> str | None:
+    """Return 'gzip', 'xz' or 'zstd' if head starts with that format's magic bytes, else None."""
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def plan_compression(path: str) -> str | None:
+    """Return the compression format of a plan file, by its magic bytes."""
+    with open(path, 'rb') as f:
+        return compression_format(f.read(COMPRESSION_MAGIC_SIZE))
+
+
+def decompressing_reader(raw, compression: str, closefd: bool = False):
+    """
+    Wrap a binary stream so that reading it decompresses it incrementally.
+
+    The result supports peek(). Closing it leaves raw open, except for zstd
+    decompressed by the zstandard package with closefd.
+    """
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if compression == 'xz':
+        return lzma.LZMAFile(raw)
+    # zstd joins the standard library in Python 3.14; before that it takes the zstandard package
+    try:
+        from compression import zstd
+        return zstd.ZstdFile(raw)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('zstd-compressed plans need the zstandard package: pip install terra-agent[zstd]') from None
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=closefd))
+
+
+def open_plan_binary(path: str):
+    """
+    Open a plan file, or stdin for '-', as a binary stream that transparently
+    decompresses gzip, xz and zstd input, detected by its magic bytes.
+    """
+    if path == '-' or path == '/dev/stdin':
+        raw = sys.stdin.buffer
+        compression = compression_format(raw.peek(COMPRESSION_MAGIC_SIZE))
+        return decompressing_reader(raw, compression) if compression else raw
+
+    compression = plan_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'xz':
+        return lzma.open(path, 'rb')
+    raw = open(path, 'rb')
+    return decompressing_reader(raw, compression, closefd=True) if compression else raw
+
+
+def open_plan_text(path: str):
+    """Like open_plan_binary, but decoded to text; uncompressed stdin is returned as sys.stdin itself."""
+    if (path == '-' or path == '/dev/stdin') and not is_compressed_stdin():
+        return sys.stdin
+    return io.TextIOWrapper(open_plan_binary(path), encoding='utf-8', errors='replace')
+
+
+def is_compressed_stdin() -> bool:
+    """Tell whether stdin starts with the magic bytes of a supported compression format."""
+    raw = getattr(sys.stdin, 'buffer', None)
+    return raw is not None and compression_format(raw.peek(COMPRESSION_MAGIC_SIZE)) is not None
+
+
+def open_plan_payload(data: bytes):
+    """Open a plan payload held in memory as a text stream, decompressing it incrementally if it is compressed."""
+    raw = io.BytesIO(data)
+    compression = compression_format(data[:COMPRESSION_MAGIC_SIZE])
+    return io.TextIOWrapper(decompressing_reader(raw, compression) if compression else raw,
+                            encoding='utf-8', errors='replace')
+
+
+def is_json_plan_file(path: str) -> bool:
+    """Tell whether a plan file holds `terraform show -json` output."""
+    with open(path, 'rb') as f:
+        return f.read(JSON_CHUNK_SIZE).lstrip().startswith(b'{')
+
+
+def _count_headers(buffer, action: str) -> int:
+    """Count the block headers of an action ("replaced", "imported") by substring search, without a scan."""
+    is_text = isinstance(buffer, str)
+    needle = f' will be {action}' if is_text else f' will be {action}'.encode()
+    prefix = '\n  # ' if is_text else b'\n  # '
+    count = 0
+    at = buffer.find(needle)
+    while at != -1:
+        line_start = buffer.rfind(prefix[:1], 0, at)
+        if line_start != -1 and buffer[line_start:line_start + len(prefix)] == prefix:
+            count += 1
+        at = buffer.find(needle, at + len(needle))
+    return count
+
+
+def count_changes(buffer, verify: bool = True) -> PlanCount:
+    """
+    Count the changes in plan output held in a buffer (str, bytes or mmap).
+
+    The count comes from Terraform's trailing "Plan: X to add, ..." line, found by
+    searching backwards from the end. Terraform counts a replaced resource as an add
+    and a destroy, and resources that are only imported in none of them, so those
+    headers are found by substring search to turn the sum into a resource count.
+    With verify, or when there is no summary line, all block headers are counted
+    instead (a scan that builds no models) and a disagreement with the summary line
+    is flagged as a mismatch. JSON plans are counted from their changed
+    resource_changes entries.
+    """
+    is_text = isinstance(buffer, str)
+    if buffer[:JSON_CHUNK_SIZE].lstrip().startswith('{' if is_text else b'{'):
+        # JSON plans have no summary line; count the changed entries as they stream by
+        plan_json = buffer if is_text else str(buffer, 'utf-8', 'replace')
+        total = sum(1 for _ in iter_resource_changes_json(text_chunks(plan_json)))
+        return PlanCount(total=total, headers=total)
+
+    count = PlanCount(total=0)
+
+    summary_at = buffer.rfind('Plan: ' if is_text else b'Plan: ')
+    summary = None
+    if summary_at != -1:
+        summary = (SUMMARY_RE_TEXT if is_text else SUMMARY_RE_BYTES).match(buffer, summary_at)
+    if summary:
+        to_import, count.to_add, count.to_change, count.to_destroy = (int(group or 0) for group in summary.groups())
+        count.to_import = to_import
+    elif buffer.rfind('No changes.' if is_text else b'No changes.') != -1:
+        count.to_import = count.to_add = count.to_change = count.to_destroy = 0
+
+    if verify or not summary:
+        count.headers = count.to_replace = count.imported_only = 0
+        for _, _, action_start, action_end, _, _ in scan_blocks(buffer):
+            count.headers += 1
+            action = text_slice(buffer, action_start, action_end)
+            if action.startswith('replaced'):
+                count.to_replace += 1
+            elif action.startswith('imported'):
+                count.imported_only += 1
+        count.total = count.headers
+        if count.to_add is not None:
+            # Each replace is also in to_add and to_destroy; pure imports are in neither
+            actions = count.headers + count.to_replace - count.imported_only
+            count.mismatch = actions != count.to_add + count.to_change + count.to_destroy
+    else:
+        count.to_replace = _count_headers(buffer, 'replaced')
+        count.imported_only = _count_headers(buffer, 'imported')
+        count.total = (count.to_add + count.to_change + count.to_destroy
+                       - count.to_replace + count.imported_only)
+    return count
+
+
+def count_plan_changes(path: str, verify: bool = True) -> PlanCount:
+    """
+    Count the changes of a plan file or stdin without parsing its resources; see count_changes.
+
+    Compressed plans can't be searched from the end, so they are streamed and their
+    resources counted as they are parsed.
+    """
     if path == '-' or path == '/dev/stdin':
-        # Read from stdin
-        plan_text = sys.stdin.read()
+        if not is_compressed_stdin():
+            return count_changes(sys.stdin.buffer.read(), verify)
+    elif not plan_compression(path):
+        return _count_plan_file(path, verify)
+
+    with open_plan_text(path) as f:
+        return count_changes_stream(f)
+
+
+def count_changes_stream(stream) -> PlanCount:
+    """Count the changes of a plan read from a text stream by parsing its resources as they arrive."""
+    total = sum(1 for _ in iter_resource_changes_stream(stream))
+    return PlanCount(total=total, headers=total)
+
+
+def _count_plan_file(path: str, verify: bool) -> PlanCount:
+
+    if is_json_plan_file(path):
+        with open(path, 'r') as f:
+            total = sum(1 for _ in iter_resource_changes_json(stream_chunks(f)))
+        return PlanCount(total=total, headers=total)
+
+    with open(path, 'rb') as f:
+        # Empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return PlanCount(total=0, headers=0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return count_changes(buffer, verify)
+
+
+def iter_resource_changes_stream(stream) -> Iterator[ResourceChange]:
+    """
+    Parse a plan from a text stream such as a pipe, yielding each ResourceChange as
+    soon as the lines closing it have arrived, so work can start before EOF.
+
+    The first non-blank line decides between text and JSON plans. JSON entries are
+    yielded once their closing brace has been read.
+    """
+    head = []
+    for line in stream:
+        head.append(line)
+        if line.strip():
+            break
+    if head and is_json_plan(head[-1]):
+        yield from iter_resource_changes_json(chain(head, stream_chunks(stream)))
     else:
-        # Read from file
+        yield from iter_resource_changes(chain(head, stream))
+
+
+def load_plan(path: str, use_mmap: bool = False, workers: int = 1) -> List[ResourceChange]:
+    """
+    Load Terraform plan from text file or stdin and return list of resource changes.
+
+    Both text plans and `terraform show -json` output are accepted; JSON is detected
+    from the first non-blank character and streamed. For text plan files, use_mmap
+    memory-maps the file and parses it at the bytes level instead of decoding it line
+    by line, and workers > 1 additionally spreads it across that many processes.
+    stdin, and files compressed with gzip, xz or zstd, are always streamed, with
+    the decompressed plan never held in memory as a whole.
+    """
+    if path == '-' or path == '/dev/stdin':
+        return list(iter_resource_changes_stream(open_plan_text(path)))
+
+    if plan_compression(path):
+        with open_plan_text(path) as f:
+            return list(iter_resource_changes_stream(f))
+
+    if is_json_plan_file(path):
         with open(path, 'r') as f:
-            plan_text = f.read()
-    
-    return parse_terraform_plan_text(plan_text)
\ No newline at end of file
+            return list(iter_resource_changes_json(stream_chunks(f)))
+
+    if workers > 1:
+        return parse_plan_parallel(path, workers=workers)
+
+    if use_mmap:
+        with open(path, 'rb') as f:
+            # Empty files can't be mapped
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            # Not closed here: undecoded attributes still point into the mapping,
+            # which is released once the last of them is decoded or dropped
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return list(iter_resource_changes_buffer(buffer))
+
+    # Stream the file rather than reading it into memory first
+    with open(path, 'r') as f:
+        return list(iter_resource_changes(f))